@@ -0,0 +1,161 @@
+import argparse
+import asyncio
+import json
+import logging
+import time
+
+import init
+from llm_cache import llm_cache
+
+# ==== CONFIGURATION ====
+DEFAULT_CONCURRENCY = 4
+DEFAULT_OUTPUT = "batch_results.jsonl"
+EMBED_MAX_BATCH = 128       # texts per Voyage request
+EMBED_MAX_WAIT = 0.05       # seconds to hold a partial embedding batch open
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# ==== CROSS-QUERY EMBEDDING BATCHER ====
+# Queries reach the embed stage at slightly different times. Instead of one
+# Voyage call per query, embedding requests are collected for up to
+# EMBED_MAX_WAIT seconds (or until EMBED_MAX_BATCH texts) and sent together.
+
+class EmbeddingBatcher:
+    def __init__(self, embed_many, max_batch: int = EMBED_MAX_BATCH, max_wait: float = EMBED_MAX_WAIT):
+        self._embed_many = embed_many
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._pending = []
+        self._timer = None
+        self._sends = set()
+        self.requests = 0
+        self.texts = 0
+
+    async def embed(self, text: str):
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append((text, fut))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+        return await fut
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._send(batch))
+            self._sends.add(task)
+            task.add_done_callback(self._sends.discard)
+
+    async def _send(self, batch):
+        self.requests += 1
+        self.texts += len(batch)
+        try:
+            vectors = await self._embed_many([text for text, _ in batch])
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for (_, fut), vector in zip(batch, vectors):
+            if not fut.done():
+                fut.set_result(vector)
+
+
+# ==== QUERY LOADING ====
+
+def load_queries(path: str = None, only: list = None) -> dict:
+    # Either the built-in benchmark suite or a JSONL file of
+    # {"name": ..., "query": ..., "template": ...} lines (name/template optional)
+    if path is None:
+        queries = dict(init.search_query)
+    else:
+        queries = {}
+        with open(path, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                obj = json.loads(line)
+                if "query" not in obj:
+                    raise ValueError(f"{path}:{line_no}: missing 'query'")
+                queries[obj.get("name") or f"query-{line_no}"] = obj
+    if only:
+        queries = {name: queries[name] for name in only}
+    return queries
+
+
+# ==== BATCH RUNNER ====
+
+async def run_one(name: str, search_obj: dict, graph, semaphore: asyncio.Semaphore, run_eval: bool) -> dict:
+    async with semaphore:
+        record = {"name": name, "query": search_obj["query"], "template": search_obj.get("template")}
+        start = time.perf_counter()
+        try:
+            results, timings = await init.run_search(search_obj, graph)
+            reranked_docs = results["rerank"]
+            ranked_ids = init.get_best_candidate_ids(reranked_docs)
+            record["vector_only"] = not ranked_ids
+            if not ranked_ids:
+                ranked_ids = [str(doc["_id"]) for doc in results["fetch"]]
+            record["ranked_ids"] = ranked_ids
+            record["ranking_scores"] = [doc.get("ranking_score") for doc in reranked_docs]
+            record["stage_timings"] = {stage: round(t, 4) for stage, t in timings.items()}
+            if run_eval and search_obj.get("template") and ranked_ids:
+                eval_response = await asyncio.to_thread(init.eval_function, ranked_ids, search_obj["template"])
+                record["average_final_score"] = eval_response.get("average_final_score")
+        except Exception as e:
+            logger.error(f"Query '{name}' failed: {e}", exc_info=True)
+            record["error"] = repr(e)
+        record["total_seconds"] = round(time.perf_counter() - start, 4)
+        return record
+
+
+async def run_batch(queries: dict, concurrency: int = DEFAULT_CONCURRENCY, output: str = DEFAULT_OUTPUT,
+                    run_eval: bool = False, embed_max_wait: float = EMBED_MAX_WAIT) -> list:
+    batcher = EmbeddingBatcher(init.acreate_embeddings, max_wait=embed_max_wait)
+
+    async def batched_embed_stage(search_obj, rewrite):
+        return await batcher.embed(search_obj["query"] + " " + rewrite)
+
+    graph = init.build_search_graph().replace("embed", batched_embed_stage)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    start = time.perf_counter()
+    records = []
+    tasks = [asyncio.ensure_future(run_one(name, obj, graph, semaphore, run_eval)) for name, obj in queries.items()]
+    with open(output, "w", encoding="utf-8") as out:
+        for task in asyncio.as_completed(tasks):
+            record = await task
+            records.append(record)
+            out.write(json.dumps(record, default=str) + "\n")
+            out.flush()
+            status = "FAILED" if "error" in record else f"{len(record['ranked_ids'])} candidates"
+            logger.info(f"[{len(records)}/{len(tasks)}] {record['name']}: {status} in {record['total_seconds']}s")
+
+    elapsed = time.perf_counter() - start
+    logger.info(f"Batch complete: {len(records)} queries in {elapsed:.2f}s "
+                f"(concurrency={concurrency}, embedding requests={batcher.requests} for {batcher.texts} texts)")
+    logger.info(f"LLM cache: {llm_cache.stats()}")
+    logger.info(f"Embeddings: {init.embedder.stats()}")
+    return records
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run many search queries concurrently")
+    parser.add_argument("--queries", help="JSONL file of queries (defaults to the built-in search_query suite)")
+    parser.add_argument("--only", help="Comma separated query names to run")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Per-query results JSONL")
+    parser.add_argument("--embed-wait-ms", type=float, default=EMBED_MAX_WAIT * 1000)
+    parser.add_argument("--eval", action="store_true", help="Score each query with the eval endpoint")
+    parser.add_argument("--verbose", action="store_true", help="Keep the per-stage pipeline logging")
+    args = parser.parse_args()
+
+    init.LOG = args.verbose
+    queries = load_queries(args.queries, args.only.split(",") if args.only else None)
+    asyncio.run(run_batch(queries, args.concurrency, args.output, args.eval, args.embed_wait_ms / 1000))
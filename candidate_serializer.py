@@ -0,0 +1,114 @@
+import json
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")   # gpt-4.1 family tokenizer
+except Exception:  # tiktoken is optional; fall back to a ~4 chars/token estimate
+    _encoding = None
+
+# ==== CONFIGURATION ====
+# Fields the re-ranker judges on, in prompt order
+RERANK_FIELDS = [
+    "headline",
+    "experience",
+    "yearsOfWorkExperience",
+    "rerankSummary",
+    "prestigeScore",
+    "skills",
+    "awardsAndCertifications",
+    "education",
+]
+# Nested keys that carry no signal for the judge (ids, links, images)
+DROP_KEYS = {"_id", "id", "embedding", "logo", "image", "picture", "photo"}
+DROP_KEY_SUFFIXES = ("Id", "Url", "URL", "url", "Logo", "logo", "Urn", "urn")
+# Progressively harsher (max string chars, max list items) levels, applied
+# until a candidate fits its token budget
+SHRINK_LEVELS = [(600, 15), (300, 10), (160, 6), (80, 4), (40, 2)]
+DEFAULT_TOKEN_BUDGET = 700
+
+
+def count_tokens(text: str) -> int:
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return len(text) // 4 + 1
+
+
+def _is_empty(value) -> bool:
+    return value is None or value == "" or value == [] or value == {}
+
+
+def _drop_key(key: str) -> bool:
+    return key in DROP_KEYS or key.endswith(DROP_KEY_SUFFIXES)
+
+
+def _compact(value, max_chars: int, max_items: int):
+    if value is None:
+        return None
+    if isinstance(value, dict):
+        compacted = {}
+        for key, item in value.items():
+            if _drop_key(key):
+                continue
+            item = _compact(item, max_chars, max_items)
+            if not _is_empty(item):
+                compacted[key] = item
+        return compacted
+    if isinstance(value, (list, tuple)):
+        items = [_compact(item, max_chars, max_items) for item in value]
+        # Drop empties and exact duplicates, keep the first max_items (most recent first)
+        seen, unique = set(), []
+        for item in items:
+            marker = json.dumps(item, sort_keys=True, default=str)
+            if _is_empty(item) or marker in seen:
+                continue
+            seen.add(marker)
+            unique.append(item)
+        return unique[:max_items]
+    if isinstance(value, str):
+        value = " ".join(value.split())
+        return value if len(value) <= max_chars else value[: max_chars - 1].rstrip() + "…"
+    if isinstance(value, float):
+        return round(value, 2)
+    if isinstance(value, (int, bool)):
+        return value
+    return str(value)
+
+
+def _dumps(obj: dict) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+# Compact copy of the re-rank fields, small enough to store in the Qdrant
+# payload (see migration STORE_RERANK_PAYLOAD) for single-hop retrieval
+def compact_candidate(doc: dict, max_chars: int = 300, max_items: int = 10) -> dict:
+    compacted = {}
+    for field in RERANK_FIELDS:
+        value = _compact(doc.get(field), max_chars, max_items)
+        if not _is_empty(value):
+            compacted[field] = value
+    return compacted
+
+
+# Text a resume is embedded from when it has no stored vector ("field: value"
+# lines over the compact re-rank fields). Must stay stable: vectors embedded
+# from a different recipe are not comparable.
+def embedding_text(doc: dict) -> str:
+    return "\n".join(f"{field}: {value if isinstance(value, str) else _dumps(value)}"
+                     for field, value in compact_candidate(doc).items())
+
+
+# ==== SERIALIZER ====
+# Compact, deterministic JSON for one candidate that fits `token_budget`
+# (`extra` keys, e.g. an existing score, are placed right after the id):
+# empty values, ids and links are dropped, whitespace is collapsed, and long
+# strings / lists are cut down level by level until the budget is met.
+
+def serialize_candidate(doc: dict, doc_id: str, token_budget: int = DEFAULT_TOKEN_BUDGET, extra: dict = None) -> str:
+    text = ""
+    for max_chars, max_items in SHRINK_LEVELS:
+        summary = {"_id": doc_id, **(extra or {}), **compact_candidate(doc, max_chars, max_items)}
+        text = _dumps(summary)
+        if count_tokens(text) <= token_budget:
+            return text
+    # The harshest level is a few hundred tokens at most; accept it as is
+    return text
@@ -0,0 +1,242 @@
+import argparse
+import statistics
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+from filters import PAYLOAD_INDEX_SCHEMA
+
+# ==== CONFIGURATION ====
+VECTOR_SIZE = 1024                  # voyage-3
+DEFAULT_INDEXING_THRESHOLD = 20_000  # Qdrant's default (KB of vectors per segment before HNSW is built)
+
+
+# ==== COLLECTION PROFILES ====
+# A profile fixes how the collection is built (HNSW graph, what lives on disk,
+# quantization) and how it is searched (hnsw_ef, rescoring). Payload indexes
+# (PAYLOAD_INDEX_SCHEMA) belong in every profile and go in before any data.
+#   low-latency: everything in RAM, denser graph, int8 vectors rescored
+#                against the originals
+#   low-memory:  original vectors and graph on disk, only 1-bit codes in RAM,
+#                heavier oversampling to make up for binary quantization
+#   bulk-load:   low-latency settings, but no graph is built while loading;
+#                finish_bulk_load() enables indexing once the data is in
+#                (any later run does it if the loading run didn't finish)
+
+@dataclass(frozen=True)
+class CollectionProfile:
+    hnsw_m: int = 16
+    ef_construct: int = 100
+    hnsw_ef: Optional[int] = None           # search-time beam width (None = Qdrant default)
+    on_disk_vectors: bool = False
+    on_disk_hnsw: bool = False
+    on_disk_payload: bool = False
+    quantization: Optional[str] = None      # None, "scalar" or "binary"
+    oversampling: float = 1.0               # with quantization: candidates rescored per result
+    defer_indexing: bool = False
+
+    def vectors_config(self, size: int = VECTOR_SIZE) -> models.VectorParams:
+        return models.VectorParams(size=size, distance=models.Distance.COSINE, on_disk=self.on_disk_vectors)
+
+    def hnsw_config(self) -> models.HnswConfigDiff:
+        # m=0 skips building the graph entirely until finish_bulk_load()
+        m = 0 if self.defer_indexing else self.hnsw_m
+        return models.HnswConfigDiff(m=m, ef_construct=self.ef_construct, on_disk=self.on_disk_hnsw)
+
+    def optimizers_config(self) -> models.OptimizersConfigDiff:
+        threshold = 0 if self.defer_indexing else DEFAULT_INDEXING_THRESHOLD
+        return models.OptimizersConfigDiff(indexing_threshold=threshold)
+
+    def quantization_config(self):
+        if self.quantization == "scalar":
+            return models.ScalarQuantization(scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8, quantile=0.99, always_ram=True))
+        if self.quantization == "binary":
+            return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+        return None
+
+    def search_params(self, exact: bool = False) -> models.SearchParams:
+        quantization = None
+        if self.quantization:
+            quantization = models.QuantizationSearchParams(rescore=True, oversampling=self.oversampling)
+        return models.SearchParams(hnsw_ef=self.hnsw_ef, exact=exact, quantization=quantization)
+
+    def estimated_ram_bytes(self, count: int, size: int = VECTOR_SIZE) -> int:
+        # Rough resident size: float32 originals, quantized codes and graph links
+        ram = 0 if self.on_disk_vectors else count * size * 4
+        if self.quantization == "scalar":
+            ram += count * size
+        elif self.quantization == "binary":
+            ram += count * size // 8
+        if not self.on_disk_hnsw:
+            ram += count * self.hnsw_m * 2 * 4      # layer-0 links dominate
+        return ram
+
+
+PROFILES = {
+    "default": CollectionProfile(),
+    "low-latency": CollectionProfile(hnsw_m=32, ef_construct=256, hnsw_ef=128, quantization="scalar",
+                                     oversampling=2.0),
+    "low-memory": CollectionProfile(hnsw_m=16, ef_construct=128, hnsw_ef=128, on_disk_vectors=True,
+                                    on_disk_hnsw=True, on_disk_payload=True, quantization="binary",
+                                    oversampling=3.0),
+    "bulk-load": CollectionProfile(hnsw_m=32, ef_construct=256, hnsw_ef=128, quantization="scalar",
+                                   oversampling=2.0, defer_indexing=True),
+}
+
+
+def get_profile(name: str) -> CollectionProfile:
+    if name not in PROFILES:
+        raise ValueError(f"Unknown collection profile '{name}', expected one of {sorted(PROFILES)}")
+    return PROFILES[name]
+
+
+def create_collection(client, collection_name: str, profile: CollectionProfile, size: int = VECTOR_SIZE):
+    client.recreate_collection(
+        collection_name=collection_name,
+        vectors_config=profile.vectors_config(size),
+        hnsw_config=profile.hnsw_config(),
+        optimizers_config=profile.optimizers_config(),
+        quantization_config=profile.quantization_config(),
+        on_disk_payload=profile.on_disk_payload,
+    )
+
+
+def create_payload_indexes(client, collection_name: str):
+    for field_name, field_schema in PAYLOAD_INDEX_SCHEMA.items():
+        client.create_payload_index(
+            collection_name=collection_name,
+            field_name=field_name,
+            field_schema=field_schema,
+            wait=True,
+        )
+
+
+def apply_profile(client, collection_name: str, profile: CollectionProfile):
+    # Moves an existing collection to `profile` (Qdrant rebuilds in the background).
+    # None would mean "keep the current quantization", so a profile without
+    # one explicitly disables it
+    client.update_collection(
+        collection_name=collection_name,
+        vectors_config={"": models.VectorParamsDiff(on_disk=profile.on_disk_vectors)},
+        hnsw_config=profile.hnsw_config(),
+        optimizers_config=profile.optimizers_config(),
+        quantization_config=profile.quantization_config() or models.Disabled.DISABLED,
+    )
+
+
+def is_bulk_loading(client, collection_name: str) -> bool:
+    # Decided from the collection itself, not from the profile a run was
+    # started with: a crashed bulk load followed by a plain `resume` or a
+    # delta sync must still get its graph
+    return client.get_collection(collection_name).config.hnsw_config.m == 0
+
+
+def finish_bulk_load(client, collection_name: str, profile: CollectionProfile = None) -> bool:
+    # Build the graph once, over all the data, instead of during every segment flush.
+    # The graph settings come from `profile` if it defers indexing, otherwise
+    # from "bulk-load" (the profile that left the collection at m=0)
+    if not is_bulk_loading(client, collection_name):
+        return False
+    if profile is None or not profile.defer_indexing:
+        profile = PROFILES["bulk-load"]
+    client.update_collection(
+        collection_name=collection_name,
+        hnsw_config=models.HnswConfigDiff(m=profile.hnsw_m, ef_construct=profile.ef_construct),
+        optimizers_config=models.OptimizersConfigDiff(indexing_threshold=DEFAULT_INDEXING_THRESHOLD),
+    )
+    return True
+
+
+def wait_until_ready(client, collection_name: str, timeout: float = 3600, poll: float = 1.0) -> float:
+    # -> seconds until optimizations (index building) finished
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        if client.get_collection(collection_name).status == models.CollectionStatus.GREEN:
+            break
+        time.sleep(poll)
+    return time.perf_counter() - started
+
+
+# ==== BENCHMARK ====
+# Loads the same synthetic, clustered corpus under every profile and reports
+# build time, estimated RAM, search latency (with and without a country
+# filter) and recall@limit against exact search. With the default ":memory:"
+# location the local client only stores the config and always searches
+# exactly, so HNSW / quantization effects need a Qdrant server (--url).
+
+def benchmark(location: str = ":memory:", api_key: str = None, count: int = 20_000, dim: int = VECTOR_SIZE,
+              queries: int = 50, limit: int = 50, profiles: list = None, batch_size: int = 500):
+    client = QdrantClient(location=location) if location == ":memory:" else QdrantClient(url=location, api_key=api_key)
+    rng = np.random.default_rng(0)
+    countries = ["United States", "India", "United Kingdom", "Germany"]
+    centers = rng.standard_normal((256, dim), dtype=np.float32)
+
+    def sample(n):
+        return centers[rng.integers(len(centers), size=n)] + rng.standard_normal((n, dim), dtype=np.float32) * 0.6
+
+    vectors = sample(count)
+    payloads = [{"mongo_id": f"{i:024x}", "country": countries[i % 4], "yearsOfWorkExperience": i % 15,
+                 "prestigeScore": float(i % 100) / 100} for i in range(count)]
+    query_vectors = sample(queries)
+    country_filter = models.Filter(must=[models.FieldCondition(key="country",
+                                                              match=models.MatchValue(value="United States"))])
+
+    print(f"{'profile':>12} {'build s':>8} {'index s':>8} {'est RAM MB':>10} "
+          f"{'p50 ms':>7} {'p95 ms':>7} {'filt p50':>8} {'recall':>7}")
+    for name in profiles or list(PROFILES):
+        profile = PROFILES[name]
+        collection_name = f"bench_{name.replace('-', '_')}"
+        started = time.perf_counter()
+        create_collection(client, collection_name, profile, size=dim)
+        create_payload_indexes(client, collection_name)
+        for start in range(0, count, batch_size):
+            client.upsert(
+                collection_name=collection_name,
+                points=models.Batch(
+                    ids=list(range(start, min(start + batch_size, count))),
+                    vectors=vectors[start : start + batch_size].tolist(),
+                    payloads=payloads[start : start + batch_size],
+                ),
+                wait=True,
+            )
+        build_seconds = time.perf_counter() - started
+        finish_bulk_load(client, collection_name, profile)
+        index_seconds = wait_until_ready(client, collection_name)
+
+        def timed(query_filter=None, exact=False):
+            latencies, results = [], []
+            for q in query_vectors:
+                t = time.perf_counter()
+                hits = client.search(collection_name=collection_name, query_vector=q.tolist(), limit=limit,
+                                     query_filter=query_filter, search_params=profile.search_params(exact=exact))
+                latencies.append((time.perf_counter() - t) * 1000)
+                results.append({hit.id for hit in hits})
+            return latencies, results
+
+        latencies, approx = timed()
+        filtered_latencies, _ = timed(country_filter)
+        _, exact = timed(exact=True)
+        recall = statistics.mean(len(a & e) / limit for a, e in zip(approx, exact))
+        p95 = sorted(latencies)[int(0.95 * (len(latencies) - 1))]
+        print(f"{name:>12} {build_seconds:8.2f} {index_seconds:8.2f} "
+              f"{profile.estimated_ram_bytes(count, dim) / 2**20:10.1f} {statistics.median(latencies):7.2f} "
+              f"{p95:7.2f} {statistics.median(filtered_latencies):8.2f} {recall:7.3f}")
+        client.delete_collection(collection_name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark Qdrant collection profiles")
+    parser.add_argument("--url", default=":memory:", help="Qdrant server URL (default: local in-memory client)")
+    parser.add_argument("--api-key", default=None)
+    parser.add_argument("--count", type=int, default=20_000)
+    parser.add_argument("--dim", type=int, default=VECTOR_SIZE)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--profiles", nargs="*", choices=sorted(PROFILES), default=None)
+    args = parser.parse_args()
+    benchmark(location=args.url, api_key=args.api_key, count=args.count, dim=args.dim, queries=args.queries,
+              profiles=args.profiles)
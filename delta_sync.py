@@ -0,0 +1,262 @@
+import argparse
+import json
+import logging
+import os
+import time
+from datetime import datetime
+
+import voyageai
+from bson.objectid import ObjectId
+from pymongo import MongoClient
+from qdrant_client.http import models as rest
+
+import migration
+from candidate_serializer import embedding_text
+from collection_profiles import finish_bulk_load
+from embeddings import Embedder, embed_with_retries
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# === CONFIGURATION ===
+os.environ.setdefault("VOYAGE_API_KEY", "")
+MONGO_URI = ""
+MONGO_DB = ""
+MONGO_COLLECTION = ""
+# Change watermark: docs are read in (WATERMARK_FIELD, _id) order. With
+# WATERMARK_FIELD = None only the ObjectId is used, i.e. new docs only.
+WATERMARK_FIELD = "updatedAt"
+# Soft-delete flag: docs with a truthy value have their point removed
+DELETED_FIELD = "isDeleted"
+SYNC_STATE_PATH = os.environ.get("SYNC_STATE_PATH", ".cache/delta_sync_state.json")
+SYNC_PAGE_SIZE = 500
+SYNC_INTERVAL = 3600            # seconds between runs with --watch
+RECONCILE_PAGE_SIZE = 1000
+
+
+# === WATERMARK ===
+# {"updated_at": watermark value or None, "updated_at_type": "datetime",
+#  "string" or "number", "last_id": ObjectId hex or None,
+#  "unstamped_id": ObjectId hex or None}; only advanced after a page is fully
+# written, so a failed run resumes from the last good page. last_id breaks
+# ties between docs sharing updated_at; docs without WATERMARK_FIELD (missing
+# or null) can only be told apart by _id, so they get their own unstamped_id.
+
+def load_watermark(path: str = SYNC_STATE_PATH) -> dict:
+    if not os.path.exists(path):
+        return {"updated_at": None, "updated_at_type": None, "last_id": None, "unstamped_id": None}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_watermark(watermark: dict, path: str = SYNC_STATE_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(watermark, f)
+    os.replace(tmp_path, path)
+
+
+def encode_watermark_value(value) -> tuple:
+    # -> (JSON-safe value, type tag); the type tag lets decode_watermark_value
+    # hand Mongo back the same BSON type, since $gt never matches across types
+    if isinstance(value, datetime):
+        return value.isoformat(), "datetime"
+    if isinstance(value, str):
+        return value, "string"
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value, "number"
+    raise ValueError(f"Unsupported {WATERMARK_FIELD} value {value!r} ({type(value).__name__}) for a watermark; "
+                     f"expected a datetime, string or number")
+
+
+def decode_watermark_value(value, value_type: str = None):
+    # State files from before updated_at_type only ever stored datetimes
+    if value_type in (None, "datetime"):
+        return datetime.fromisoformat(value)
+    return value
+
+
+def changed_since(watermark: dict) -> dict:
+    last_id = ObjectId(watermark["last_id"]) if watermark.get("last_id") else None
+    if WATERMARK_FIELD is None:
+        return {"_id": {"$gt": last_id}} if last_id else {}
+    unstamped_id = watermark.get("unstamped_id")
+    # {field: None} matches docs where the field is missing or null
+    unstamped = {WATERMARK_FIELD: None}
+    if unstamped_id:
+        unstamped["_id"] = {"$gt": ObjectId(unstamped_id)}
+    updated_at = watermark.get("updated_at")
+    if updated_at is None:
+        if last_id is None and unstamped_id is None:
+            return {}
+        # Only unstamped docs seen so far: every stamped doc is new
+        return {"$or": [{WATERMARK_FIELD: {"$ne": None}}, unstamped]}
+    updated_at = decode_watermark_value(updated_at, watermark.get("updated_at_type"))
+    # Docs sharing the watermark timestamp are told apart by _id
+    return {"$or": [
+        {WATERMARK_FIELD: {"$gt": updated_at}},
+        {WATERMARK_FIELD: updated_at, "_id": {"$gt": last_id}},
+        unstamped,
+    ]}
+
+
+def advance(watermark: dict, page: list) -> dict:
+    # The page is in (WATERMARK_FIELD, _id) order, which puts unstamped docs first
+    if WATERMARK_FIELD is None:
+        return {"updated_at": None, "updated_at_type": None, "last_id": str(page[-1]["_id"]), "unstamped_id": None}
+    stamped = [doc for doc in page if doc.get(WATERMARK_FIELD) is not None]
+    unstamped = [doc for doc in page if doc.get(WATERMARK_FIELD) is None]
+    watermark = dict(watermark)
+    if stamped:
+        # updated_at and last_id always move together
+        watermark["updated_at"], watermark["updated_at_type"] = encode_watermark_value(stamped[-1][WATERMARK_FIELD])
+        watermark["last_id"] = str(stamped[-1]["_id"])
+    if unstamped:
+        watermark["unstamped_id"] = str(unstamped[-1]["_id"])
+    return watermark
+
+
+# === QDRANT WRITES ===
+
+def _mongo_id_filter(mongo_ids: list, keep_point_ids: list = None) -> rest.FilterSelector:
+    return rest.FilterSelector(filter=rest.Filter(
+        must=[rest.FieldCondition(key="mongo_id", match=rest.MatchAny(any=mongo_ids))],
+        must_not=[rest.HasIdCondition(has_id=keep_point_ids)] if keep_point_ids else None,
+    ))
+
+
+def delete_by_mongo_id(mongo_ids: list, keep_point_ids: list = None):
+    # keep_point_ids: drop any other point of these docs, e.g. ones written
+    # with random ids before point ids became deterministic
+    if not mongo_ids:
+        return
+    migration.qdrant.delete(
+        collection_name=migration.QDRANT_COLLECTION,
+        points_selector=_mongo_id_filter(mongo_ids, keep_point_ids),
+        wait=True,
+    )
+
+
+def sync_page(docs: list, embedder: Embedder, page_num: int, rerank_payload: bool) -> dict:
+    deleted = [str(doc["_id"]) for doc in docs if doc.get(DELETED_FIELD)]
+    live = [doc for doc in docs if not doc.get(DELETED_FIELD)]
+
+    # Only docs without a stored vector go to Voyage; docs with nothing to
+    # embed are skipped (as in migration), not sent as empty texts
+    to_embed = [(doc, text) for doc, text in ((doc, embedding_text(doc)) for doc in live if not doc.get("embedding"))
+                if text]
+    if to_embed:
+        # Backs off on Voyage rate limits instead of failing the whole sync
+        vectors = embed_with_retries(embedder, [text for _, text in to_embed], input_type="document")
+        for (doc, _), vector in zip(to_embed, vectors):
+            doc["embedding"] = vector
+
+    # A malformed doc is logged and skipped: raising here would stop the
+    # watermark at this page, and every later run would fail on it again
+    points, skipped, malformed = [], 0, 0
+    for doc in live:
+        try:
+            point = migration.doc_to_point(doc, rerank_payload)
+        except migration.MALFORMED_DOC_ERRORS as e:
+            logger.warning(f"Skipping malformed doc {doc.get('_id')} on sync page {page_num}: {e!r}")
+            malformed += 1
+            continue
+        if point is None:
+            skipped += 1
+        else:
+            points.append(point)
+    upserted = migration.upsert_chunk(points, "sync", page_num) if points else 0
+    if points and not upserted:
+        raise RuntimeError(f"Upsert of sync page {page_num} failed")
+    delete_by_mongo_id([point.payload["mongo_id"] for point in points], [point.id for point in points])
+    delete_by_mongo_id(deleted)
+    return {"upserted": upserted, "embedded": len(to_embed), "deleted": len(deleted), "skipped": skipped,
+            "malformed": malformed}
+
+
+# === SYNC ===
+
+def run_sync(collection, embedder: Embedder, rerank_payload: bool = False, state_path: str = SYNC_STATE_PATH) -> dict:
+    started = time.perf_counter()
+    watermark = load_watermark(state_path)
+    sort = ([(WATERMARK_FIELD, 1)] if WATERMARK_FIELD else []) + [("_id", 1)]
+    cursor = collection.find(changed_since(watermark)).sort(sort).batch_size(SYNC_PAGE_SIZE)
+    logger.info(f"Syncing changes since {watermark}")
+
+    totals = {"pages": 0, "docs": 0, "upserted": 0, "embedded": 0, "deleted": 0, "skipped": 0, "malformed": 0}
+    page = []
+
+    def flush():
+        nonlocal watermark
+        totals["pages"] += 1
+        counts = sync_page(page, embedder, totals["pages"], rerank_payload)
+        totals["docs"] += len(page)
+        for key, value in counts.items():
+            totals[key] += value
+        watermark = advance(watermark, page)
+        save_watermark(watermark, state_path)
+
+    for doc in cursor:
+        page.append(doc)
+        if len(page) >= SYNC_PAGE_SIZE:
+            flush()
+            page = []
+    if page:
+        flush()
+
+    totals["seconds"] = round(time.perf_counter() - started, 2)
+    logger.info(f"Sync complete: {totals}; watermark {watermark}")
+    return totals
+
+
+def reconcile(collection) -> int:
+    # Hard deletes leave no trace behind the watermark: compare every point's
+    # mongo_id with Mongo and remove the orphans
+    removed = 0
+    offset = None
+    while True:
+        points, offset = migration.qdrant.scroll(
+            collection_name=migration.QDRANT_COLLECTION,
+            limit=RECONCILE_PAGE_SIZE,
+            offset=offset,
+            with_payload=["mongo_id"],
+            with_vectors=False,
+        )
+        mongo_ids = list({point.payload["mongo_id"] for point in points if point.payload.get("mongo_id")})
+        if mongo_ids:
+            existing = {str(doc["_id"]) for doc in collection.find(
+                {"_id": {"$in": [ObjectId(mongo_id) for mongo_id in mongo_ids]}}, {"_id": 1})}
+            orphans = [mongo_id for mongo_id in mongo_ids if mongo_id not in existing]
+            delete_by_mongo_id(orphans)
+            removed += len(orphans)
+        if offset is None:
+            break
+    logger.info(f"Reconcile removed points of {removed} deleted doc(s)")
+    return removed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incrementally sync changed resumes from MongoDB to Qdrant")
+    parser.add_argument("--rerank-payload", action="store_true", help="Store compact re-rank fields in the payload")
+    parser.add_argument("--reconcile", action="store_true", help="Also remove points whose Mongo doc is gone")
+    parser.add_argument("--reset", action="store_true", help="Forget the watermark and sync everything")
+    parser.add_argument("--watch", action="store_true", help=f"Keep syncing every SYNC_INTERVAL ({SYNC_INTERVAL}s)")
+    args = parser.parse_args()
+
+    mongo_collection = MongoClient(MONGO_URI)[MONGO_DB][MONGO_COLLECTION]
+    embedder = Embedder(voyageai.Client(api_key=os.environ["VOYAGE_API_KEY"]))
+    if args.reset and os.path.exists(SYNC_STATE_PATH):
+        os.remove(SYNC_STATE_PATH)
+    migration.ensure_collection()
+
+    while True:
+        run_sync(mongo_collection, embedder, rerank_payload=args.rerank_payload)
+        if args.reconcile:
+            reconcile(mongo_collection)
+        # A bulk load that never finished would leave the collection without a graph
+        if finish_bulk_load(migration.qdrant, migration.QDRANT_COLLECTION):
+            logger.info(f"Finished an interrupted bulk load of '{migration.QDRANT_COLLECTION}'")
+        if not args.watch:
+            break
+        time.sleep(SYNC_INTERVAL)
@@ -0,0 +1,141 @@
+import os
+import sqlite3
+import time
+from threading import Lock
+
+
+# ==== SQLITE KEY/VALUE CACHE ====
+# Shared persistent store for the pipeline caches: values are opaque bytes,
+# entries expire after `ttl` seconds and the least recently used entries are
+# evicted once the total stored size exceeds `max_bytes`.
+
+class DiskCache:
+    def __init__(self, path: str, max_bytes: int = None, ttl: float = None, enabled: bool = True):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = Lock()
+        self._conn = None
+        self._size = 0
+
+    def _connect(self):
+        # Opened lazily so importing a module with a cache never touches disk
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL,"
+                " created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache(accessed_at)")
+            self._size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        return self._conn
+
+    def get(self, key: str):
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: list) -> dict:
+        if not self.enabled or not keys:
+            return {}
+        now = time.time()
+        found = {}
+        with self._lock:
+            conn = self._connect()
+            # Stay well below SQLite's bound-parameter limit
+            for i in range(0, len(keys), 500):
+                chunk = keys[i : i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    f"SELECT key, value, created_at FROM cache WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                expired = []
+                for key, value, created_at in rows:
+                    if self.ttl is not None and now - created_at > self.ttl:
+                        expired.append(key)
+                    else:
+                        found[key] = value
+                if expired:
+                    self._delete(expired)
+                if found:
+                    hit_keys = [key for key in chunk if key in found]
+                    conn.executemany("UPDATE cache SET accessed_at = ? WHERE key = ?", [(now, key) for key in hit_keys])
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put(self, key: str, value: bytes):
+        self.put_many({key: value})
+
+    def put_many(self, items: dict):
+        if not self.enabled or not items:
+            return
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN")
+            try:
+                for key, value in items.items():
+                    old = conn.execute("SELECT size FROM cache WHERE key = ?", (key,)).fetchone()
+                    if old:
+                        self._size -= old[0]
+                    conn.execute(
+                        "INSERT OR REPLACE INTO cache (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                        (key, value, len(value), now, now),
+                    )
+                    self._size += len(value)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                self._size = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+                raise
+            self._evict()
+
+    def _delete(self, keys: list):
+        conn = self._connect()
+        placeholders = ",".join("?" * len(keys))
+        freed = conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM cache WHERE key IN ({placeholders})", keys).fetchone()[0]
+        conn.execute(f"DELETE FROM cache WHERE key IN ({placeholders})", keys)
+        self._size -= freed
+
+    def _evict(self):
+        if self.max_bytes is None or self._size <= self.max_bytes:
+            return
+        conn = self._connect()
+        # Drop least recently used entries until we are back under budget
+        victims = []
+        excess = self._size - self.max_bytes
+        for key, size in conn.execute("SELECT key, size FROM cache ORDER BY accessed_at ASC"):
+            if excess <= 0:
+                break
+            victims.append(key)
+            excess -= size
+        for i in range(0, len(victims), 500):
+            self._delete(victims[i : i + 500])
+        self.evictions += len(victims)
+
+    def clear(self):
+        with self._lock:
+            self._connect().execute("DELETE FROM cache")
+            self._size = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._connect().execute("SELECT COUNT(*) FROM cache").fetchone()[0] if self.enabled else 0
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": entries,
+                "bytes": self._size,
+            }
@@ -0,0 +1,79 @@
+from collections import OrderedDict
+from threading import Lock
+
+from bson.objectid import ObjectId
+
+from candidate_serializer import RERANK_FIELDS
+
+# ==== CONFIGURATION ====
+MONGO_IN_CHUNK = 500        # ids per $in query
+DOC_CACHE_SIZE = 5000       # candidate docs kept in process
+
+
+# ==== CANDIDATE DOCUMENT STORE ====
+# Fetches only the fields the re-ranker reads, returns docs in the order the
+# ids were given (i.e. Qdrant similarity order) and keeps a bounded LRU of
+# recently fetched candidates. Callers get shallow copies, since re-ranking
+# writes scores onto the docs.
+
+class DocumentStore:
+    def __init__(self, collection, fields: list = RERANK_FIELDS, chunk_size: int = MONGO_IN_CHUNK,
+                 cache_size: int = DOC_CACHE_SIZE):
+        self.collection = collection
+        self.projection = {field: 1 for field in fields}
+        self.chunk_size = chunk_size
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.queries = 0
+
+    def _cache_get(self, ids: list) -> dict:
+        found = {}
+        with self._lock:
+            for oid in ids:
+                doc = self._cache.get(oid)
+                if doc is not None:
+                    self._cache.move_to_end(oid)
+                    found[oid] = doc
+            self.hits += len(found)
+            self.misses += len(ids) - len(found)
+        return found
+
+    def _cache_put(self, docs: dict):
+        with self._lock:
+            for oid, doc in docs.items():
+                self._cache[oid] = doc
+                self._cache.move_to_end(oid)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+                self.evictions += 1
+
+    def fetch(self, object_ids: list) -> list:
+        ids = list(dict.fromkeys(str(oid) for oid in object_ids))
+        docs = self._cache_get(ids)
+        missing = [oid for oid in ids if oid not in docs]
+        fetched = {}
+        for i in range(0, len(missing), self.chunk_size):
+            chunk = [ObjectId(oid) for oid in missing[i : i + self.chunk_size]]
+            self.queries += 1
+            for doc in self.collection.find({"_id": {"$in": chunk}}, self.projection):
+                fetched[str(doc["_id"])] = doc
+        self._cache_put(fetched)
+        docs.update(fetched)
+        # Restore the caller's (similarity) order; ids missing from Mongo are skipped
+        return [dict(docs[oid]) for oid in ids if oid in docs]
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "cached_docs": len(self._cache),
+                "mongo_queries": self.queries,
+            }
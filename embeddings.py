@@ -0,0 +1,175 @@
+import asyncio
+import hashlib
+import math
+import os
+import random
+import time
+from array import array
+from types import SimpleNamespace
+
+from disk_cache import DiskCache
+
+# ==== CONFIGURATION ====
+VOYAGE_MODEL = "voyage-3"
+VOYAGE_MAX_BATCH = 1000             # texts per embed request (voyage-3 limit)
+VOYAGE_MAX_BATCH_TOKENS = 120_000   # tokens per embed request (voyage-3 limit)
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite")
+EMBEDDING_CACHE_MAX_BYTES = 512 * 1024 * 1024
+EMBEDDING_CACHE_ENABLED = os.environ.get("EMBEDDING_CACHE", "1") != "0"
+EMBED_MAX_RETRIES = 5
+EMBED_RETRY_BASE_DELAY = 1.0        # seconds, doubled per attempt
+
+# Vectors for a given (model, input_type, text) never change, so no TTL
+embedding_cache = DiskCache(EMBEDDING_CACHE_PATH, max_bytes=EMBEDDING_CACHE_MAX_BYTES, enabled=EMBEDDING_CACHE_ENABLED)
+
+
+def embedding_key(model: str, input_type: str, text: str) -> str:
+    return f"{model}:{input_type}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+
+def pack_vector(vector) -> bytes:
+    # Compact float32 blob: 4KB for a 1024-dim voyage-3 vector
+    return array("f", vector).tobytes()
+
+
+def unpack_vector(blob: bytes) -> list:
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+def approx_tokens(text: str) -> int:
+    # Deliberately pessimistic (~3 chars per token) so batches stay under the limit
+    return len(text) // 3 + 1
+
+
+def make_batches(texts: list, max_batch: int = VOYAGE_MAX_BATCH, max_tokens: int = VOYAGE_MAX_BATCH_TOKENS) -> list:
+    batches = []
+    batch, batch_tokens = [], 0
+    for text in texts:
+        tokens = approx_tokens(text)
+        if batch and (len(batch) >= max_batch or batch_tokens + tokens > max_tokens):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(text)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+# ==== CACHED, BATCHED EMBEDDER ====
+# Duplicate texts are embedded once, cached vectors are served from disk and
+# only the remaining texts are sent to Voyage, packed into as few requests as
+# the batch limits allow.
+
+class Embedder:
+    def __init__(self, client=None, async_client=None, model: str = VOYAGE_MODEL, cache: DiskCache = embedding_cache):
+        self.client = client
+        self.async_client = async_client
+        self.model = model
+        self.cache = cache
+        self.api_requests = 0
+        self.api_texts = 0
+
+    def _lookup(self, texts: list, input_type: str):
+        unique = list(dict.fromkeys(texts))
+        keys = {text: embedding_key(self.model, input_type, text) for text in unique}
+        cached = self.cache.get_many(list(keys.values()))
+        vectors = {text: unpack_vector(cached[key]) for text, key in keys.items() if key in cached}
+        missing = [text for text in unique if text not in vectors]
+        return keys, vectors, missing
+
+    def _store(self, keys: dict, vectors: dict, batch: list, embedded: list):
+        self.api_requests += 1
+        self.api_texts += len(batch)
+        blobs = {keys[text]: pack_vector(vector) for text, vector in zip(batch, embedded)}
+        # Callers get the float32-rounded vector a cache hit would return, so
+        # a cold and a warm run search with exactly the same query vector
+        for text in batch:
+            vectors[text] = unpack_vector(blobs[keys[text]])
+        self.cache.put_many(blobs)
+
+    def embed(self, texts: list, input_type: str = "query") -> list:
+        keys, vectors, missing = self._lookup(texts, input_type)
+        for batch in make_batches(missing):
+            response = self.client.embed(texts=batch, model=self.model, input_type=input_type)
+            self._store(keys, vectors, batch, response.embeddings)
+        return [vectors[text] for text in texts]
+
+    async def aembed(self, texts: list, input_type: str = "query") -> list:
+        keys, vectors, missing = self._lookup(texts, input_type)
+
+        async def embed_batch(batch):
+            response = await self.async_client.embed(texts=batch, model=self.model, input_type=input_type)
+            self._store(keys, vectors, batch, response.embeddings)
+
+        await asyncio.gather(*(embed_batch(batch) for batch in make_batches(missing)))
+        return [vectors[text] for text in texts]
+
+    def stats(self) -> dict:
+        stats = self.cache.stats()
+        return {
+            "cache_hits": stats["hits"],
+            "cache_misses": stats["misses"],
+            "hit_rate": stats["hit_rate"],
+            "cached_vectors": stats["entries"],
+            "api_requests": self.api_requests,
+            "api_texts": self.api_texts,
+        }
+
+
+# ==== RETRIES ====
+# Batches that did succeed are already cached by the Embedder, so a retry only
+# re-sends what is still missing.
+
+def is_rate_limited(error: Exception) -> bool:
+    # voyageai.error.RateLimitError (or the stub's), or anything reporting HTTP 429
+    return (type(error).__name__ == "RateLimitError"
+            or getattr(error, "http_status", None) == 429
+            or "429" in str(error))
+
+
+def embed_with_retries(embedder: Embedder, texts: list, input_type: str = "document",
+                       max_retries: int = EMBED_MAX_RETRIES, base_delay: float = EMBED_RETRY_BASE_DELAY) -> list:
+    for attempt in range(max_retries + 1):
+        try:
+            return embedder.embed(texts, input_type=input_type)
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            # Rate limits get a full exponential backoff, other errors a short one;
+            # jitter keeps concurrent workers from retrying in lockstep
+            delay = base_delay * 2 ** attempt * (1.0 if is_rate_limited(e) else 0.25)
+            time.sleep(delay * random.uniform(0.5, 1.5))
+
+
+# ==== STUB CLIENT ====
+# Offline stand-in for voyageai.Client (same embed() signature): deterministic
+# unit vectors per text, with optional latency and an injected 429 on every
+# `rate_limit_every`-th call. For exercising ingestion without an API key.
+
+class RateLimitError(Exception):
+    pass
+
+
+class StubVoyageClient:
+    def __init__(self, dim: int = 1024, latency: float = 0.0, rate_limit_every: int = 0):
+        self.dim = dim
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.calls = 0
+
+    def _vector(self, text: str) -> list:
+        rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+        vector = [rng.gauss(0.0, 1.0) for _ in range(self.dim)]
+        norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+        return [x / norm for x in vector]
+
+    def embed(self, texts: list, model: str = None, input_type: str = None):
+        self.calls += 1
+        if self.rate_limit_every and self.calls % self.rate_limit_every == 0:
+            raise RateLimitError("429: stub rate limit")
+        if self.latency:
+            time.sleep(self.latency)
+        return SimpleNamespace(embeddings=[self._vector(text) for text in texts])
@@ -0,0 +1,90 @@
+from dataclasses import dataclass
+from typing import Optional
+
+from qdrant_client.http import models
+
+# Payload fields the search filters target, with the Qdrant index type each
+# one needs so filtered searches hit a payload index instead of a full scan.
+PAYLOAD_INDEX_SCHEMA = {
+    "country": models.PayloadSchemaType.KEYWORD,
+    "yearsOfWorkExperience": models.PayloadSchemaType.INTEGER,
+    "prestigeScore": models.PayloadSchemaType.FLOAT,
+    # Not a search filter: lets incremental sync delete/replace points by source doc
+    "mongo_id": models.PayloadSchemaType.KEYWORD,
+}
+
+
+def _number(value, cast):
+    if value is None or value == "":
+        return None
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _bounds(value, cast):
+    # Accepts {"min": x, "max": y} or a bare number meaning "at least x"
+    if isinstance(value, dict):
+        return _number(value.get("min"), cast), _number(value.get("max"), cast)
+    return _number(value, cast), None
+
+
+# ==== SEARCH FILTER MODEL ====
+
+@dataclass(frozen=True)
+class SearchFilter:
+    country: Optional[str] = None
+    min_years: Optional[int] = None
+    max_years: Optional[int] = None
+    min_prestige: Optional[float] = None
+    max_prestige: Optional[float] = None
+
+    @classmethod
+    def from_llm_output(cls, data: dict) -> "SearchFilter":
+        # Output of FILTER_EXTRACTION_PROMPT; unknown keys and bad values are ignored
+        if not isinstance(data, dict):
+            return cls()
+        country = data.get("country")
+        country = country.strip() if isinstance(country, str) and country.strip() else None
+        min_years, max_years = _bounds(data.get("yearsOfWorkExperience"), int)
+        min_prestige, max_prestige = _bounds(data.get("prestigeScore"), float)
+        return cls(country, min_years, max_years, min_prestige, max_prestige)
+
+    def __bool__(self):
+        return any(value is not None for value in (
+            self.country, self.min_years, self.max_years, self.min_prestige, self.max_prestige
+        ))
+
+    def conditions(self) -> list:
+        # Qdrant-style conditions, also understood by vector_index.LocalVectorIndex
+        must = []
+        if self.country:
+            must.append({"key": "country", "match": {"value": self.country}})
+        for key, low, high in (
+            ("yearsOfWorkExperience", self.min_years, self.max_years),
+            ("prestigeScore", self.min_prestige, self.max_prestige),
+        ):
+            bounds = {}
+            if low is not None:
+                bounds["gte"] = low
+            if high is not None:
+                bounds["lte"] = high
+            if bounds:
+                must.append({"key": key, "range": bounds})
+        return must
+
+    def to_dict(self) -> Optional[dict]:
+        must = self.conditions()
+        return {"must": must} if must else None
+
+    def to_qdrant(self) -> Optional[models.Filter]:
+        must = []
+        for condition in self.conditions():
+            if "match" in condition:
+                must.append(models.FieldCondition(
+                    key=condition["key"], match=models.MatchValue(value=condition["match"]["value"])
+                ))
+            else:
+                must.append(models.FieldCondition(key=condition["key"], range=models.Range(**condition["range"])))
+        return models.Filter(must=must) if must else None
@@ -1,15 +1,25 @@
 import openai
 import voyageai
-from qdrant_client import QdrantClient
+from qdrant_client import AsyncQdrantClient, QdrantClient
 from pymongo import MongoClient
-from bson.objectid import ObjectId
+import asyncio
 import json
 import os
 import logging
 import requests
 
-from prompts import FILTER_EXTRACTION_PROMPT, QUERY_REWRITE_PROMPT_HARD_CRITERIA, QUERY_REWRITE_PROMPT_SOFT_CRITERIA, get_re_ranking_prompt
-from schema import RE_RANK_SCHEMA, ENHANCED_RE_RANK_SCHEMA
+from prompts import FILTER_EXTRACTION_PROMPT, QUERY_REWRITE_PROMPT_HARD_CRITERIA, QUERY_REWRITE_PROMPT_SOFT_CRITERIA, RE_RANKING_RULES, get_explanation_prompt, get_fast_re_ranking_prompt, get_re_ranking_prompt
+from schema import RE_RANK_SCHEMA, ENHANCED_RE_RANK_SCHEMA, EXPLANATION_SCHEMA, FAST_RE_RANK_SCHEMA, FAST_RE_RANK_WITH_CODES_SCHEMA
+from orchestrator import StageGraph
+from llm_cache import achat_completion, chat_completion, llm_cache
+from embeddings import Embedder
+from vector_index import LocalVectorIndex
+from filters import SearchFilter
+from collection_profiles import get_profile
+from candidate_serializer import count_tokens, serialize_candidate
+from rerank import RankingStream, atournament_rerank, attach_ranking, tournament_rerank
+from score_cache import ScoreCache, merge_scored, prompt_version
+from doc_store import DocumentStore
 
 # Your search input
 # search_query = "Mathematician with a PhD from a leading U.S, specializing in statistical inference and stochastic processes. Published and experienced in both theoretical and applied research."
@@ -69,82 +79,124 @@ MONGO_URI = ""
 MONGO_DB = ""
 MONGO_COLLECTION = ""
 
+# Retrieval backend: "qdrant" (cloud collection) or "local" (in-process
+# vector_index.LocalVectorIndex, see `python vector_index.py export`)
+RETRIEVAL_BACKEND = "qdrant"
+LOCAL_INDEX_PATH = "local_index"
+LOCAL_INDEX_MODE = "exact"      # "exact" brute force or "ivf"
+LOCAL_INDEX_NPROBE = 16
+# Build candidate docs from the Qdrant payload (migrated with --rerank-payload)
+# and only go to MongoDB for points that lack it
+RETRIEVAL_SINGLE_HOP = False
+# Profile the collection was built with (see collection_profiles.py); sets
+# the search-time hnsw_ef and quantization rescoring
+QDRANT_PROFILE = "default"
+
+# Re-ranking: "batched" (chunked tournament), "single" (one prompt for all
+# candidates) or "stream" (one streamed prompt, candidates scored as they arrive)
+RERANK_MODE = "batched"
+RERANK_CHUNK_SIZE = 10
+RERANK_WORKERS = 5
+RERANK_MAX_RETRIES = 2
+RERANK_FINAL_TOP_K = 20         # 0 disables the final pass over the merged top-k
+RERANK_CANDIDATE_TOKEN_BUDGET = 700
+# Scoring: "full" (constraint checklist + reason for every candidate) or "fast"
+# (scores only; reasons generated afterwards for the top RERANK_EXPLAIN_TOP_K)
+RERANK_SCORING = "full"
+RERANK_FAILURE_CODES = False    # fast scoring: also return failed-constraint codes
+RERANK_EXPLAIN_TOP_K = 10
+RERANK_SCORE_CACHE = True       # reuse per-candidate scores across searches (see score_cache.py)
+
 # ==== OPENAI AND VOYAGE CLIENTS INIT ====
 openai.api_key = os.environ["OPENAI_API_KEY"]
 voyage_client = voyageai.Client(api_key=os.environ["VOYAGE_API_KEY"])
 qdrant = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
+embedder = Embedder(voyage_client, model="voyage-3")
+# The async Voyage / Qdrant clients hold httpx connections tied to the event
+# loop that opened them, so run_search creates them per loop (see bind_async_clients)
+qdrant_async = None
+_async_clients_loop = None
+score_cache = ScoreCache()
 mongo_client = MongoClient(MONGO_URI)
 mongo_collection = mongo_client[MONGO_DB][MONGO_COLLECTION]
+doc_store = DocumentStore(mongo_collection)
+local_index = None
 
 # ==== CORE FUNCTIONS ====
+# Each LLM / vector call is split into a request builder and a response parser
+# so the sync functions and their async counterparts share the same logic.
 
-def get_transformed_query(query, rewrite_prompt):
+def _rewrite_request(query, rewrite_prompt):
     messages = [
         {"role": "system", "content": "You are an expert recruiter and search query rewriter."},
         {"role": "user", "content": f"{rewrite_prompt} {query}"},
     ]
-    response = openai.ChatCompletion.create(
+    return dict(
         model="gpt-4.1-nano",
         messages=messages,
         max_tokens=4000,
     )
+
+
+def _parse_rewrite_response(response):
     return response["choices"][0]["message"]["content"].strip()
 
 
-def extract_filters(query):
+def get_transformed_query(query, rewrite_prompt):
+    response = chat_completion(**_rewrite_request(query, rewrite_prompt))
+    return _parse_rewrite_response(response)
+
+
+async def aget_transformed_query(query, rewrite_prompt):
+    response = await achat_completion(**_rewrite_request(query, rewrite_prompt))
+    return _parse_rewrite_response(response)
+
+
+def _filters_request(query):
     messages = [
         {"role": "system", "content": "You extract JSON filters."},
         {"role": "user", "content": FILTER_EXTRACTION_PROMPT + query},
     ]
-    response = openai.ChatCompletion.create(
+    return dict(
         model="gpt-4.1-nano",
         messages=messages,
         max_tokens=6000,
     )
-    # Robust decoding
+
+
+def _parse_filters_response(response):
+    # Robust decoding: anything unparseable means "no filters"
     try:
         filters_json = response["choices"][0]["message"]["content"].strip()
-        filters = json.loads(filters_json)
-        must = []
-        if filters.get("country"):
-            must.append({"key": "country", "match": {"value": filters["country"]}})
-        years_filter = filters.get("yearsOfWorkExperience")
-        if years_filter and isinstance(years_filter, dict):
-            range_filter = {}
-            if "min" in years_filter and years_filter["min"] is not None:
-                range_filter["gte"] = years_filter["min"]
-            if "max" in years_filter and years_filter["max"] is not None:
-                range_filter["lte"] = years_filter["max"]
-            if range_filter:
-                must.append({"key": "yearsOfWorkExperience", "range": range_filter})
-        final_filter = {"must": must} if must else {}
-        return final_filter
+        return SearchFilter.from_llm_output(json.loads(filters_json))
     except Exception:
-        return {}
+        return SearchFilter()
+
+
+def extract_filters(query):
+    response = chat_completion(**_filters_request(query))
+    return _parse_filters_response(response)
+
+
+async def aextract_filters(query):
+    response = await achat_completion(**_filters_request(query))
+    return _parse_filters_response(response)
 
 
 def create_embedding(text):
-    embed_response = voyage_client.embed(
-        texts=[text], model="voyage-3", input_type="query"
-    )
-    return embed_response.embeddings[0]
+    return embedder.embed([text], input_type="query")[0]
 
 
-def query_qdrant(embedding, filters):
-    # Build Qdrant filter structure
-    must = []
-    if filters.get("country"):
-        must.append({"key": "country", "match": {"value": filters["country"]}})
-    if filters.get("yearsOfWorkExperience"):
-        must.append({"key": "yearsOfWorkExperience", "range": {"gte": filters["yearsOfWorkExperience"]}})
-    final_filter = {"must": must} if must else None
+async def acreate_embedding(text):
+    return (await embedder.aembed([text], input_type="query"))[0]
 
-    result = qdrant.search(
-        collection_name=QDRANT_COLLECTION,
-        query_vector=embedding,
-        limit=50,
-        query_filter=final_filter,
-    )
+
+async def acreate_embeddings(texts):
+    # Many query texts in as few Voyage requests as possible (used by the batch runner)
+    return await embedder.aembed(list(texts), input_type="query")
+
+
+def _parse_qdrant_result(result):
     # Get (mongo_id, prestigeScore)
     id_score_pairs = []
     for point in result:
@@ -156,52 +208,115 @@ def query_qdrant(embedding, filters):
     # id_score_pairs.sort(key=lambda tup: tup[1], reverse=True)
     return [pair[0] for pair in id_score_pairs]
 
-def rerank_documents(query: str, docs_to_rerank: list) -> list:
+
+def get_local_index():
+    global local_index
+    if local_index is None:
+        local_index = LocalVectorIndex.load(LOCAL_INDEX_PATH)
+    return local_index
+
+
+def _local_search(embedding, filters: SearchFilter):
+    return get_local_index().search(
+        embedding,
+        limit=50,
+        query_filter=filters.to_dict(),
+        mode=LOCAL_INDEX_MODE,
+        nprobe=LOCAL_INDEX_NPROBE,
+    )
+
+
+def _search_payload():
+    # Two-hop retrieval only reads the ids and prestige off each hit; the
+    # re-rank payload is needed (and worth transferring) only in single-hop mode
+    return True if RETRIEVAL_SINGLE_HOP else ["mongo_id", "prestigeScore"]
+
+
+def search_points(embedding, filters: SearchFilter):
+    # Scored points with payloads, from whichever retrieval backend is configured
+    if RETRIEVAL_BACKEND == "local":
+        return _local_search(embedding, filters)
+    return qdrant.search(
+        collection_name=QDRANT_COLLECTION,
+        query_vector=embedding,
+        limit=50,
+        query_filter=filters.to_qdrant(),
+        search_params=get_profile(QDRANT_PROFILE).search_params(),
+        with_payload=_search_payload(),
+    )
+
+
+async def asearch_points(embedding, filters: SearchFilter):
+    if RETRIEVAL_BACKEND == "local":
+        return await asyncio.to_thread(_local_search, embedding, filters)
+    return await qdrant_async.search(
+        collection_name=QDRANT_COLLECTION,
+        query_vector=embedding,
+        limit=50,
+        query_filter=filters.to_qdrant(),
+        search_params=get_profile(QDRANT_PROFILE).search_params(),
+        with_payload=_search_payload(),
+    )
+
+
+def query_qdrant(embedding, filters: SearchFilter):
+    return _parse_qdrant_result(search_points(embedding, filters))
+
+
+async def aquery_qdrant(embedding, filters: SearchFilter):
+    return _parse_qdrant_result(await asearch_points(embedding, filters))
+
+
+RERANK_SYSTEM_PROMPT = "You are a veteran recruiter and also an expert in proof reading and validating the correctness of facts like location of company/university, skills and finding the perfert candidate for the requirements and rating them on the same."
+
+
+def _rerank_request(query, docs_to_rerank):
 
     # Limit doc count to keep prompt small and cost effective
     # docs_to_rerank = docs[:max_docs_for_rerank]
 
     docs_by_id = {}
-    # Create a simple summary string for each doc to feed LLM
-    # Customize which fields are most relevant for your use case
+    # Compact, token-budgeted JSON summary for each doc to feed LLM
+    # (see candidate_serializer.RERANK_FIELDS for the fields used)
     doc_summaries = []
     for idx, doc in enumerate(docs_to_rerank):
         doc_id = "doc-" + str(idx + 1)
         # doc_id = str(doc["_id"])
         docs_by_id[doc_id] = doc
-        summary = {
-            "_id": doc_id,
-            "headline": doc.get("headline", "NA"),
-            "experience": doc["experience"],
-            "yearsOfWorkExperience": doc["yearsOfWorkExperience"],
-            "rerankSummary": doc["rerankSummary"],
-            "prestigeScore": doc["prestigeScore"],
-            "skills": doc["skills"],
-            "awardsAndCertifications": doc["awardsAndCertifications"],
-            "education": doc["education"]
-        }
-        doc_summaries.append(str(summary))
+        doc_summaries.append(serialize_candidate(doc, doc_id, RERANK_CANDIDATE_TOKEN_BUDGET))
 
-    prompt = get_re_ranking_prompt(query, doc_summaries)
-    if LOG: print(f"Created re-ranking prompt")
+    if RERANK_SCORING == "fast":
+        prompt = get_fast_re_ranking_prompt(query, doc_summaries, RERANK_FAILURE_CODES)
+        schema = FAST_RE_RANK_WITH_CODES_SCHEMA if RERANK_FAILURE_CODES else FAST_RE_RANK_SCHEMA
+        # ~15 output tokens per candidate (a few more with failure codes)
+        max_tokens = 200 + 40 * len(doc_summaries)
+    else:
+        prompt = get_re_ranking_prompt(query, doc_summaries)
+        schema = ENHANCED_RE_RANK_SCHEMA
+        max_tokens = 10000
+    if LOG: print(f"Created re-ranking prompt: {count_tokens(prompt)} tokens for {len(doc_summaries)} candidates")
 
-    response = openai.ChatCompletion.create(
+    request = dict(
         model="gpt-4.1-nano",
         messages=[
-            {"role": "system", "content": "You are a veteran recruiter and also an expert in proof reading and validating the correctness of facts like location of company/university, skills and finding the perfert candidate for the requirements and rating them on the same."},
+            {"role": "system", "content": RERANK_SYSTEM_PROMPT},
             {"role": "user", "content": prompt}
         ],
-        max_tokens=10000,
+        max_tokens=max_tokens,
         temperature=0.0,
         n=1,
         response_format={
             "type": "json_schema", 
             "json_schema": {
                 "name": "ranking_response_schema",  # required string identifier
-                "schema": ENHANCED_RE_RANK_SCHEMA
+                "schema": schema
             }
         }
     )
+    return request, docs_by_id
+
+
+def _parse_rerank_response(response, docs_by_id, docs_to_rerank, strict=False):
     if LOG: print("Re-ranking response completed")
     reranked_docs = []
     try:
@@ -211,15 +326,14 @@ def rerank_documents(query: str, docs_to_rerank: list) -> list:
         doc_list_sorted = sorted(ranking["results"], key=lambda obj: obj["ranking_score"], reverse = True)
         # print(f"doc_list_sorted : {doc_list_sorted}")
         for obj in doc_list_sorted:
-            key = obj["_id"].strip()
-            if key in docs_by_id and obj["ranking_score"] > 0: 
-                cur_doc = docs_by_id[key]
-                cur_doc["ranking_score"] = obj["ranking_score"]
-                cur_doc["detailed_reason_for_ranking"] = obj["detailed_reason_for_ranking"]
+            cur_doc = attach_ranking(obj, docs_by_id)
+            if cur_doc is not None:
                 reranked_docs.append(cur_doc)
             else: 
-                if LOG: print(f"key not found : {key}")
+                if LOG: print(f"key not found : {obj['_id']}")
     except Exception as e:
+        # Batched reranking retries the chunk instead of falling back
+        if strict: raise
         logging.error("Error occurred: %s", e, exc_info=True)
         # If parsing fails, fallback to original order
         ranking = list(range(len(docs_to_rerank)))
@@ -229,11 +343,162 @@ def rerank_documents(query: str, docs_to_rerank: list) -> list:
     return reranked_docs
 
 
+def rerank_documents(query: str, docs_to_rerank: list, strict=False, refresh_cache=False) -> list:
+    request, docs_by_id = _rerank_request(query, docs_to_rerank)
+    response = chat_completion(refresh_cache=refresh_cache, **request)
+    return _parse_rerank_response(response, docs_by_id, docs_to_rerank, strict)
+
+
+async def arerank_documents(query: str, docs_to_rerank: list, strict=False, refresh_cache=False) -> list:
+    request, docs_by_id = _rerank_request(query, docs_to_rerank)
+    response = await achat_completion(refresh_cache=refresh_cache, **request)
+    return _parse_rerank_response(response, docs_by_id, docs_to_rerank, strict)
+
+
+# On-demand explanations: after fast scoring, only the candidates actually
+# shown get a constraint checklist and reason (attached to the docs in place)
+def _explain_request(query, docs_to_explain):
+    docs_by_id = {}
+    doc_summaries = []
+    for idx, doc in enumerate(docs_to_explain):
+        doc_id = "doc-" + str(idx + 1)
+        docs_by_id[doc_id] = doc
+        doc_summaries.append(serialize_candidate(
+            doc, doc_id, RERANK_CANDIDATE_TOKEN_BUDGET, extra={"ranking_score": doc.get("ranking_score")}
+        ))
+    request = dict(
+        model="gpt-4.1-nano",
+        messages=[
+            {"role": "system", "content": RERANK_SYSTEM_PROMPT},
+            {"role": "user", "content": get_explanation_prompt(query, doc_summaries)}
+        ],
+        max_tokens=200 + 300 * len(doc_summaries),
+        temperature=0.0,
+        n=1,
+        response_format={
+            "type": "json_schema",
+            "json_schema": {
+                "name": "explanation_response_schema",
+                "schema": EXPLANATION_SCHEMA
+            }
+        }
+    )
+    return request, docs_by_id
+
+
+def _parse_explain_response(response, docs_by_id):
+    try:
+        explanations = json.loads(response.choices[0].message['content'].strip())["results"]
+    except Exception as e:
+        logging.error("Failed to parse explanations: %s", e, exc_info=True)
+        return
+    for obj in explanations:
+        doc = docs_by_id.get(str(obj.get("_id", "")).strip())
+        if doc is None:
+            if LOG: print(f"key not found : {obj.get('_id')}")
+            continue
+        for field in ("hard_constraints_passed", "hard_constraints_failed", "detailed_reason_for_ranking"):
+            doc[field] = obj.get(field)
+
+
+def explain_candidates(query: str, docs_to_explain: list) -> list:
+    if not docs_to_explain:
+        return docs_to_explain
+    request, docs_by_id = _explain_request(query, docs_to_explain)
+    _parse_explain_response(chat_completion(**request), docs_by_id)
+    return docs_to_explain
+
+
+async def aexplain_candidates(query: str, docs_to_explain: list) -> list:
+    if not docs_to_explain:
+        return docs_to_explain
+    request, docs_by_id = _explain_request(query, docs_to_explain)
+    _parse_explain_response(await achat_completion(**request), docs_by_id)
+    return docs_to_explain
+
+
+# Streaming reranking: iterate the returned RankingStream to get each scored
+# candidate doc as soon as its results[] element has been generated, then
+# call .ranked() for the final sorted list. Streams bypass the LLM cache.
+def _content_deltas(response):
+    for chunk in response:
+        content = chunk["choices"][0]["delta"].get("content")
+        if content:
+            yield content
+
+
+async def _acontent_deltas(response):
+    async for chunk in response:
+        content = chunk["choices"][0]["delta"].get("content")
+        if content:
+            yield content
+
+
+def stream_rerank_documents(query: str, docs_to_rerank: list) -> RankingStream:
+    request, docs_by_id = _rerank_request(query, docs_to_rerank)
+    response = chat_completion(stream=True, **request)
+    return RankingStream(_content_deltas(response), docs_by_id)
+
+
+async def astream_rerank_documents(query: str, docs_to_rerank: list) -> RankingStream:
+    request, docs_by_id = _rerank_request(query, docs_to_rerank)
+    response = await achat_completion(stream=True, **request)
+    return RankingStream(_acontent_deltas(response), docs_by_id)
+
+
+# Batched reranking: RERANK_CHUNK_SIZE candidates per prompt, scored concurrently,
+# merged by score and the top RERANK_FINAL_TOP_K re-scored together.
+# Retries skip the LLM cache so a bad cached response isn't replayed.
+def rerank_documents_batched(query: str, docs_to_rerank: list) -> list:
+    def score_chunk(chunk, attempt):
+        return rerank_documents(query, chunk, strict=True, refresh_cache=attempt > 0)
+
+    return tournament_rerank(
+        docs_to_rerank, score_chunk, chunk_size=RERANK_CHUNK_SIZE, workers=RERANK_WORKERS,
+        max_retries=RERANK_MAX_RETRIES, final_top_k=RERANK_FINAL_TOP_K,
+    )
+
+
+async def arerank_documents_batched(query: str, docs_to_rerank: list) -> list:
+    async def score_chunk(chunk, attempt):
+        return await arerank_documents(query, chunk, strict=True, refresh_cache=attempt > 0)
+
+    return await atournament_rerank(
+        docs_to_rerank, score_chunk, chunk_size=RERANK_CHUNK_SIZE, workers=RERANK_WORKERS,
+        max_retries=RERANK_MAX_RETRIES, final_top_k=RERANK_FINAL_TOP_K,
+    )
+
+
 def fetch_mongo_docs(object_ids):
-    # Convert to ObjectId type for MongoDB queries
-    obj_id_objs = [ObjectId(oid) for oid in object_ids]
-    docs = list(mongo_collection.find({"_id": {"$in": obj_id_objs}}))
-    return docs
+    # Projected to the re-rank fields, in Qdrant order, served from the doc LRU when possible
+    return doc_store.fetch(object_ids)
+
+
+def docs_from_payload(points):
+    # Single-hop retrieval: points migrated with STORE_RERANK_PAYLOAD carry the
+    # re-rank fields under payload["rerank"]. Returns (docs by mongo_id, ids
+    # whose payload lacks them and must come from MongoDB)
+    docs, missing = {}, []
+    for point in points:
+        payload = point.payload or {}
+        mongo_id = payload.get("mongo_id")
+        if not mongo_id:
+            continue
+        if payload.get("rerank"):
+            docs[mongo_id] = {
+                "_id": mongo_id,
+                "yearsOfWorkExperience": payload.get("yearsOfWorkExperience"),
+                "prestigeScore": payload.get("prestigeScore"),
+                **payload["rerank"],
+            }
+        else:
+            missing.append(mongo_id)
+    return docs, missing
+
+
+async def afetch_mongo_docs(object_ids):
+    # pymongo is blocking, so run it off the event loop
+    return await asyncio.to_thread(fetch_mongo_docs, object_ids)
 
 def eval_function(object_ids: list, template: str):
     url = "https://mercor-dev--search-eng-interview.modal.run/evaluate"
@@ -255,58 +520,157 @@ def eval_function(object_ids: list, template: str):
     print(f"{template} average_final_score -> {eval_response["average_final_score"]}")
     print("================================= RESULT ============================================")
     if LOG: print(f"\n Full Eval response for : {eval_response}")
+    return eval_response
 
 
 # ==== MAIN PIPELINE ====
-
-def main(search_obj: object):
+# Stage dependency graph (stages with no path between them run concurrently):
+#   rewrite, filters  <- search_obj
+#   embed             <- search_obj, rewrite
+#   retrieve          <- embed, filters
+#   fetch             <- retrieve
+#   rerank            <- rewrite, filters, fetch
+
+async def _rewrite_stage(search_obj):
     # Step 1: Rewrite search query using GPT
-    hard_criteria = get_transformed_query(search_obj["query"], QUERY_REWRITE_PROMPT_HARD_CRITERIA)
-    # soft_criteria = get_transformed_query(search_obj["query"], QUERY_REWRITE_PROMPT_SOFT_CRITERIA)
-    rewritten_query = hard_criteria
-    if LOG: print("[Step 1] Rewritten Query:", rewritten_query)
+    hard_criteria = await aget_transformed_query(search_obj["query"], QUERY_REWRITE_PROMPT_HARD_CRITERIA)
+    # soft_criteria = await aget_transformed_query(search_obj["query"], QUERY_REWRITE_PROMPT_SOFT_CRITERIA)
+    if LOG: print("[Step 1] Rewritten Query:", hard_criteria)
+    return hard_criteria
 
+
+async def _filters_stage(search_obj):
     # Step 2: Extract filter values
-    filters = extract_filters(search_obj["query"])
+    filters = await aextract_filters(search_obj["query"])
     if LOG: print("[Step 2] Filter values extracted:", filters)
+    return filters
+
 
+async def _embed_stage(search_obj, rewrite):
     # Step 3: Embed the query using Voyage-3
-    embedding = create_embedding(search_obj["query"] + " " + rewritten_query)
+    embedding = await acreate_embedding(search_obj["query"] + " " + rewrite)
     if LOG: print("[Step 3] Embedding created, first 5 dims:", embedding[:5])
+    return embedding
 
-    # Step 4: Qdrant vector search with filters and prestigeScore ordering
-    matched_mongo_ids = query_qdrant(embedding, filters)
-    if LOG: print("[Step 4] Qdrant returned MongoIDs:", matched_mongo_ids)
 
-    # Step 5: Retrieve documents from MongoDB and print
-    docs = fetch_mongo_docs(matched_mongo_ids)
+async def _retrieve_stage(embed, filters):
+    # Step 4: Qdrant vector search with filters and prestigeScore ordering
+    points = await asearch_points(embed, filters)
+    if LOG: print("[Step 4] Qdrant returned MongoIDs:", _parse_qdrant_result(points))
+    return points
+
+
+async def _fetch_stage(retrieve):
+    # Step 5: Retrieve documents from MongoDB (only those without a re-rank payload in single-hop mode)
+    matched_mongo_ids = _parse_qdrant_result(retrieve)
+    if RETRIEVAL_SINGLE_HOP:
+        docs_by_id, missing = docs_from_payload(retrieve)
+        if missing:
+            docs_by_id.update((str(doc["_id"]), doc) for doc in await afetch_mongo_docs(missing))
+        docs = [docs_by_id[oid] for oid in dict.fromkeys(matched_mongo_ids) if oid in docs_by_id]
+        if LOG: print(f"[Step 5] Candidate documents: {len(docs)} ({len(missing)} fetched from MongoDB)")
+        return docs
+    docs = await afetch_mongo_docs(matched_mongo_ids)
     if LOG: print("[Step 5] Candidate documents:", len(docs))
+    return docs
+
 
-    # Step 6 : Re-rank docs
-    if (len(filters) > 0):
-        country_name = filters['must'][0]['match']['value']
+def get_rerank_query(rewrite, filters: SearchFilter):
+    rewritten_query = rewrite
+    if filters.country:
+        country_name = filters.country
         rewritten_query = rewritten_query + "\n Note: Validate carefully if the eduction and experience is from country for scoring -> " + country_name
-    reranked_docs = rerank_documents(rewritten_query, docs)
-
-    # Batched reranking
-    # final_rerank_docs = []
-    # docs_batch = []
-    # for doc in docs:
-    #     docs_batch.append(doc)
-    #     if (len(docs_batch) == 10):
-    #         reranked_docs = rerank_documents(rewritten_query, docs_batch)
-    #         final_rerank_docs.extend(reranked_docs)
-    #         docs_batch = []
-    # final_rerank_docs = sorted(final_rerank_docs, key=lambda obj: obj["ranking_score"], reverse = True)
-    # # Final Reranking
-    # reranked_docs = rerank_documents(rewritten_query, final_rerank_docs[:50])
-
-    count = 0
+    return rewritten_query
+
+
+async def _arerank(rewritten_query, docs):
+    if RERANK_MODE == "batched":
+        return await arerank_documents_batched(rewritten_query, docs)
+    if RERANK_MODE == "stream":
+        stream = await astream_rerank_documents(rewritten_query, docs)
+        async for doc in stream:
+            if LOG: print(f"[Step 6] Scored {doc['_id']} -> {doc['ranking_score']}")
+        if LOG: print(f"[Step 6] First candidate after {stream.first_candidate_seconds}s, all after {stream.total_seconds}s")
+        return stream.ranked()
+    return await arerank_documents(rewritten_query, docs)
+
+
+def _rerank_prompt_version():
+    # Batched scores depend on which candidates share a chunk and on the final
+    # pass over the merged top-k, so both settings are part of the version
+    return prompt_version(RE_RANKING_RULES, RERANK_MODE, RERANK_SCORING, RERANK_FAILURE_CODES, RERANK_CANDIDATE_TOKEN_BUDGET,
+                          RERANK_CHUNK_SIZE, RERANK_FINAL_TOP_K, "gpt-4.1-nano")
+
+
+async def _rerank_stage(rewrite, filters, fetch):
+    # Step 6 : Re-rank docs, sending only candidates without a cached score
+    rewritten_query = get_rerank_query(rewrite, filters)
+    if not RERANK_SCORE_CACHE:
+        return await _arerank(rewritten_query, fetch)
+    version = _rerank_prompt_version()
+    cached_docs, uncached_docs = score_cache.split(rewritten_query, fetch, version)
+    if LOG: print(f"[Step 6] Cached scores: {len(cached_docs)}, candidates to score: {len(uncached_docs)}")
+    fresh_docs = await _arerank(rewritten_query, uncached_docs) if uncached_docs else []
+    score_cache.store_scored(rewritten_query, uncached_docs, version)
+    return merge_scored(cached_docs, fresh_docs)
+
+
+def build_search_graph():
+    graph = StageGraph(inputs=["search_obj"])
+    graph.add("rewrite", _rewrite_stage, deps=["search_obj"])
+    graph.add("filters", _filters_stage, deps=["search_obj"])
+    graph.add("embed", _embed_stage, deps=["search_obj", "rewrite"])
+    graph.add("retrieve", _retrieve_stage, deps=["embed", "filters"])
+    graph.add("fetch", _fetch_stage, deps=["retrieve"])
+    graph.add("rerank", _rerank_stage, deps=["rewrite", "filters", "fetch"])
+    return graph
+
+
+SEARCH_GRAPH = build_search_graph()
+
+
+def bind_async_clients():
+    # main() runs every query in its own asyncio.run; clients from a previous
+    # (now closed) loop would fail with "Event loop is closed"
+    global qdrant_async, _async_clients_loop
+    loop = asyncio.get_running_loop()
+    if loop is not _async_clients_loop:
+        qdrant_async = AsyncQdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
+        embedder.async_client = voyageai.AsyncClient(api_key=os.environ["VOYAGE_API_KEY"])
+        _async_clients_loop = loop
+
+
+async def run_search(search_obj: object, graph: StageGraph = None):
+    # Returns (stage results, per-stage timings in seconds)
+    bind_async_clients()
+    return await (graph or SEARCH_GRAPH).run(search_obj=search_obj)
+
+
+def get_best_candidate_ids(reranked_docs):
     best_candidate_ids = []
     for doc in reranked_docs:
         doc_id = str(doc["_id"])
         if doc_id not in best_candidate_ids: best_candidate_ids.append(doc_id)
-        count+=1
+    return best_candidate_ids
+
+
+def main(search_obj: object):
+    results, timings = asyncio.run(run_search(search_obj))
+    if LOG: print("Stage timings:", {name: round(t, 3) for name, t in timings.items()})
+    if LOG: print("LLM cache:", llm_cache.stats())
+    if LOG: print("Embeddings:", embedder.stats())
+    if LOG: print("Rerank score cache:", score_cache.store.stats())
+    if LOG: print("Mongo docs:", doc_store.stats())
+    docs = results["fetch"]
+    reranked_docs = results["rerank"]
+
+    # Fast scoring generated no reasons; explain just the candidates shown
+    if RERANK_SCORING == "fast" and RERANK_EXPLAIN_TOP_K:
+        shown = explain_candidates(get_rerank_query(results["rewrite"], results["filters"]), reranked_docs[:RERANK_EXPLAIN_TOP_K])
+        for doc in shown:
+            if LOG: print(f"{doc['_id']} ({doc.get('ranking_score')}): {doc.get('detailed_reason_for_ranking')}")
+
+    best_candidate_ids = get_best_candidate_ids(reranked_docs)
     print(f"best_candidate_ids : {best_candidate_ids}")
 
     # Step 7 : Eval
@@ -0,0 +1,60 @@
+import hashlib
+import json
+import os
+
+import openai
+
+from disk_cache import DiskCache
+
+# ==== CONFIGURATION ====
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", ".cache/llm_cache.sqlite")
+LLM_CACHE_MAX_BYTES = 256 * 1024 * 1024
+LLM_CACHE_TTL = 7 * 24 * 3600           # seconds
+# Bypass switch: LLM_CACHE=0 disables both lookups and writes
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE", "1") != "0"
+
+llm_cache = DiskCache(LLM_CACHE_PATH, max_bytes=LLM_CACHE_MAX_BYTES, ttl=LLM_CACHE_TTL, enabled=LLM_CACHE_ENABLED)
+
+
+# Content address of a chat completion request: model, messages, sampling
+# parameters and response_format all go into the key, so any prompt change
+# misses the cache while byte-identical requests hit it.
+def cache_key(request: dict) -> str:
+    canonical = json.dumps(request, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _cacheable(request: dict, bypass_cache: bool) -> bool:
+    # Streams are consumed incrementally by the caller and can't be replayed
+    return llm_cache.enabled and not bypass_cache and not request.get("stream")
+
+
+def _load(value: bytes):
+    # Rebuild an OpenAIObject so both response["choices"] and response.choices work
+    return openai.util.convert_to_openai_object(json.loads(value))
+
+
+# refresh_cache skips the lookup but stores the new response, e.g. when the
+# cached one turned out to be unusable and the call is being retried
+def chat_completion(bypass_cache: bool = False, refresh_cache: bool = False, **request):
+    if not _cacheable(request, bypass_cache):
+        return openai.ChatCompletion.create(**request)
+    key = cache_key(request)
+    cached = None if refresh_cache else llm_cache.get(key)
+    if cached is not None:
+        return _load(cached)
+    response = openai.ChatCompletion.create(**request)
+    llm_cache.put(key, json.dumps(response).encode("utf-8"))
+    return response
+
+
+async def achat_completion(bypass_cache: bool = False, refresh_cache: bool = False, **request):
+    if not _cacheable(request, bypass_cache):
+        return await openai.ChatCompletion.acreate(**request)
+    key = cache_key(request)
+    cached = None if refresh_cache else llm_cache.get(key)
+    if cached is not None:
+        return _load(cached)
+    response = await openai.ChatCompletion.acreate(**request)
+    llm_cache.put(key, json.dumps(response).encode("utf-8"))
+    return response
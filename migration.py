@@ -1,16 +1,28 @@
+import os
 import time
 import gzip
+import io
 import json
 import requests
 import argparse
 import logging
+import queue
+import threading
 from threading import Lock
 import concurrent.futures
+import multiprocessing
 import uuid
 
+import voyageai
 from qdrant_client import QdrantClient
 from qdrant_client.http import models as rest
 
+from filters import PAYLOAD_INDEX_SCHEMA
+from collection_profiles import PROFILES, apply_profile, create_collection, finish_bulk_load, get_profile
+from candidate_serializer import compact_candidate, embedding_text
+from embeddings import Embedder, StubVoyageClient, embed_with_retries
+from vector_index import IndexWriter
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -20,8 +32,37 @@ STREAMING_ENDPOINT_BASE = ""
 QDRANT_API_KEY = ""
 QDRANT_CLOUD_URL = ""
 QDRANT_COLLECTION = ""
+VOYAGE_API_KEY = ""
+# collection_profiles.PROFILES: "default", "low-latency", "low-memory", "bulk-load"
+COLLECTION_PROFILE = "default"
 MAX_RETRIES = 5
 NUM_THREADS = 5
+UPSERT_CHUNK_SIZE = 500
+# Staged pipeline (see run_pipeline): workers per stage and queue bounds
+FETCH_WORKERS = 4
+PARSE_WORKERS = 2
+PARSE_IN_PROCESSES = False  # parse blocks in a process pool instead of threads
+UPSERT_WORKERS = 4
+PARSE_QUEUE_SIZE = 8        # raw line blocks waiting to be parsed
+UPSERT_QUEUE_SIZE = 16      # point chunks waiting to be written
+UPSERT_BARRIER_EVERY = 20   # every Nth upsert per worker waits for Qdrant to apply
+STATS_INTERVAL = 10         # seconds between throughput log lines
+# Docs streamed without an `embedding` are embedded with Voyage instead of skipped
+EMBED_MISSING = True
+EMBED_BATCH_DOCS = 256      # docs gathered (across blocks) per embed request group
+EMBED_MAX_WAIT = 2.0        # seconds a partial group may wait for more docs
+EMBED_CONCURRENCY = 4       # embed groups in flight at Voyage
+EMBED_QUEUE_SIZE = 8        # blocks waiting for their missing embeddings
+# Completed batches/chunks of the current load, so `resume` redoes only the rest
+CHECKPOINT_PATH = os.environ.get("MIGRATION_CHECKPOINT_PATH", ".cache/migration_checkpoint.json")
+# Optional local snapshot (vector_index format: memory-mapped vectors.npy,
+# columnar payload arrays, mongo_id -> row order), see --snapshot
+SNAPSHOT_DTYPE = "float16"
+# Point ids are uuid5(POINT_ID_NAMESPACE, mongo_id): re-running a load overwrites instead of duplicating
+POINT_ID_NAMESPACE = uuid.UUID("9a88ee2e-665b-47a0-9f24-1a47de1557ac")
+# Also store the compact re-rank fields under payload["rerank"], so search can
+# skip the MongoDB round trip (init.RETRIEVAL_SINGLE_HOP)
+STORE_RERANK_PAYLOAD = False
 
 # Initialize Qdrant client
 qdrant = QdrantClient(
@@ -30,90 +71,538 @@ qdrant = QdrantClient(
 )
 
 # Ensure collection exists with vector and payload schema
-def ensure_collection():
+def ensure_collection(profile_name: str = COLLECTION_PROFILE):
     try:
         qdrant.get_collection(QDRANT_COLLECTION)
-        logger.info(f"Collection '{QDRANT_COLLECTION}' already exists")
+        logger.info(f"Collection '{QDRANT_COLLECTION}' already exists (use `tune` to change its profile)")
     except Exception:
-        logger.info(f"Creating collection '{QDRANT_COLLECTION}'")
-        qdrant.recreate_collection(
-            collection_name=QDRANT_COLLECTION,
-            vectors_config=rest.VectorParams(
-                size=1024,            # adjust to your embedding dim
-                distance=rest.Distance.COSINE,
-            ),
-            # No explicit payload schema needed in Qdrant; any payload is allowed
-        )
+        logger.info(f"Creating collection '{QDRANT_COLLECTION}' with profile '{profile_name}'")
+        create_collection(qdrant, QDRANT_COLLECTION, get_profile(profile_name))
+        # No explicit payload schema needed in Qdrant; any payload is allowed
+    ensure_payload_indexes()
+
+# Index the payload fields search filters on (country, YoE, prestige) so
+# filtered searches use the indexes instead of scanning every point
+def ensure_payload_indexes():
+    for field_name, field_schema in PAYLOAD_INDEX_SCHEMA.items():
+        try:
+            qdrant.create_payload_index(
+                collection_name=QDRANT_COLLECTION,
+                field_name=field_name,
+                field_schema=field_schema,
+                wait=True,
+            )
+            logger.info(f"Payload index on '{field_name}' ({field_schema}) ready")
+        except Exception as e:
+            logger.warning(f"Could not create payload index on '{field_name}': {e}")
+
+def point_id(mongo_id) -> str:
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, str(mongo_id)))
+
+
+def doc_to_point(doc: dict, rerank_payload: bool = None):
+    # skip if no embedding
+    embedding = doc.get("embedding")
+    if not embedding:
+        return None
+    if rerank_payload is None:
+        rerank_payload = STORE_RERANK_PAYLOAD
+
+    payload = {
+        "mongo_id": str(doc["_id"]),
+        "yearsOfWorkExperience": int(doc.get("yearsOfWorkExperience", 0)),
+        "prestigeScore": float(doc.get("prestigeScore", 0)),
+        "country": str(doc.get("country", "")),
+    }
+    if rerank_payload:
+        payload["rerank"] = compact_candidate(doc)
+    return rest.PointStruct(
+        id=point_id(doc["_id"]),    # Qdrant can accept string IDs
+        vector=embedding,
+        payload=payload,
+    )
+
+
+# What doc_to_point (or json.loads before it) raises on a malformed doc, e.g.
+# a null yearsOfWorkExperience
+MALFORMED_DOC_ERRORS = (json.JSONDecodeError, KeyError, TypeError, ValueError)
+
+
+def iter_ndjson_lines(resp):
+    # Decompress the gzip body incrementally straight off the socket and yield
+    # one decoded line at a time, instead of materialising the whole batch
+    resp.raw.decode_content = True      # undo any transport Content-Encoding, like iter_content
+    with gzip.GzipFile(fileobj=resp.raw) as gz:
+        for line in io.TextIOWrapper(gz, encoding="utf-8"):
+            if line.strip():
+                yield line
+
+
+def iter_batch_docs(resp, batch_num: int):
+    for line in iter_ndjson_lines(resp):
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            logger.warning(f"Skipping malformed line in batch {batch_num}")
+
+
+def upsert_chunk(chunk: list, batch_num: int, chunk_num: int, wait: bool = True) -> int:
+    for attempt in range(MAX_RETRIES):
+        try:
+            qdrant.upsert(
+                collection_name=QDRANT_COLLECTION,
+                wait=wait,
+                points=chunk,
+            )
+            logger.info(f"Upserted {len(chunk)} points from batch {batch_num} (chunk {chunk_num})")
+            return len(chunk)
+        except Exception as e:
+            logger.error(f"Upsert error (batch {batch_num}, chunk {chunk_num}, attempt {attempt+1}): {e}")
+            time.sleep(2 ** attempt)
+    logger.error(f"Failed to upsert chunk {chunk_num} of batch {batch_num} after {MAX_RETRIES} attempts")
+    return 0
+
 
 def fetch_and_upsert_batch(batch_num: int):
     endpoint = f"{STREAMING_ENDPOINT_BASE}/{batch_num}"
     logger.info(f"Fetching batch {batch_num} from {endpoint}")
 
+    # Points are flushed every UPSERT_CHUNK_SIZE as the batch streams in, so a
+    # worker only ever holds one chunk in memory
+    total_upserted = 0
+    chunk = []
+    chunk_num = 0
+    total_points = 0
     try:
-        resp = requests.get(endpoint, stream=True, timeout=600)
-        resp.raise_for_status()
-
-        compressed = b"".join(resp.iter_content(chunk_size=64*1024))
-        decompressed = gzip.decompress(compressed).decode("utf-8")
+        with requests.get(endpoint, stream=True, timeout=600) as resp:
+            resp.raise_for_status()
+            for doc in iter_batch_docs(resp, batch_num):
+                point = doc_to_point(doc)
+                if point is None:
+                    continue
+                chunk.append(point)
+                total_points += 1
+                if len(chunk) >= UPSERT_CHUNK_SIZE:
+                    chunk_num += 1
+                    total_upserted += upsert_chunk(chunk, batch_num, chunk_num)
+                    chunk = []
     except Exception as e:
+        # Chunks already flushed stay upserted; the partial chunk is flushed below
         logger.error(f"Error fetching/decompressing batch {batch_num}: {e}")
-        return 0
 
-    points = []
-    for line in decompressed.splitlines():
-        if not line.strip():
-            continue
+    if chunk:
+        chunk_num += 1
+        total_upserted += upsert_chunk(chunk, batch_num, chunk_num)
+
+    print(f"batch no : {batch_num} -> total points upserted: {total_upserted}/{total_points}")
+    if not total_points:
+        logger.info(f"No valid points in batch {batch_num}")
+    return total_upserted
+
+
+# === CHECKPOINTS ===
+# A chunk is one block of UPSERT_CHUNK_SIZE lines of a batch, numbered in
+# stream order, so the same batch always yields the same chunks. A chunk is
+# recorded once Qdrant accepted its upsert (or it had no points); a batch is
+# complete once all of its chunks are, and its chunk list is then dropped.
+# path=None keeps the state in memory only (snapshot-only runs).
+
+class MigrationCheckpoint:
+    def __init__(self, path: str = CHECKPOINT_PATH):
+        self.path = path
+        self._lock = Lock()
+        self.completed_batches = set()
+        self.chunks = {}            # batch -> completed chunk numbers
+        self.chunk_counts = {}      # batch -> chunks in the batch, once fully streamed
+        if path and os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            self.completed_batches = set(state.get("completed_batches", []))
+            self.chunks = {int(b): set(c) for b, c in state.get("chunks", {}).items()}
+            self.chunk_counts = {int(b): n for b, n in state.get("chunk_counts", {}).items()}
+
+    def _save(self):
+        if not self.path:
+            return
+        state = {
+            "completed_batches": sorted(self.completed_batches),
+            "chunks": {str(b): sorted(c) for b, c in self.chunks.items()},
+            "chunk_counts": {str(b): n for b, n in self.chunk_counts.items()},
+        }
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)     # never leave a half-written checkpoint
+
+    def _complete_if_done(self, batch_num: int):
+        count = self.chunk_counts.get(batch_num)
+        if count is not None and len(self.chunks.get(batch_num, ())) >= count:
+            self.completed_batches.add(batch_num)
+            self.chunks.pop(batch_num, None)
+            self.chunk_counts.pop(batch_num, None)
+            logger.info(f"Batch {batch_num} complete ({count} chunks)")
+
+    def batch_done(self, batch_num: int) -> bool:
+        with self._lock:
+            return batch_num in self.completed_batches
+
+    def chunk_done(self, batch_num: int, chunk_num: int) -> bool:
+        with self._lock:
+            return batch_num in self.completed_batches or chunk_num in self.chunks.get(batch_num, ())
+
+    def mark_chunk(self, batch_num: int, chunk_num: int):
+        with self._lock:
+            self.chunks.setdefault(batch_num, set()).add(chunk_num)
+            self._complete_if_done(batch_num)
+            self._save()
+
+    def set_chunk_count(self, batch_num: int, count: int):
+        with self._lock:
+            self.chunk_counts[batch_num] = count
+            self._complete_if_done(batch_num)
+            self._save()
+
+    def clear(self):
+        with self._lock:
+            self.completed_batches.clear()
+            self.chunks.clear()
+            self.chunk_counts.clear()
+            if self.path and os.path.exists(self.path):
+                os.remove(self.path)
+
+    def summary(self) -> str:
+        with self._lock:
+            partial = sum(len(c) for c in self.chunks.values())
+            return f"{len(self.completed_batches)} batches complete, {partial} chunks of unfinished batches done"
+
+
+# === STAGED PIPELINE ===
+# fetch -> parse -> upsert, each stage with its own workers, connected by
+# bounded queues so a slow stage holds back the ones feeding it instead of
+# letting blocks pile up in memory:
+#   fetch:  streams + decompresses a batch, emits blocks of UPSERT_CHUNK_SIZE lines
+#   parse:  json -> PointStructs (optionally in a process pool, it is CPU bound)
+#   embed:  blocks with docs lacking an embedding wait here; their docs are
+#           gathered across blocks into large Voyage requests (at most
+#           EMBED_CONCURRENCY in flight) before the block moves on
+#   upsert: writes with wait=False; every UPSERT_BARRIER_EVERY-th write per
+#           worker and a final update_barrier() wait for Qdrant to apply them.
+#           With a snapshot writer, every chunk is also appended to the local
+#           snapshot (or only there, with write_qdrant=False)
+
+# points counts raw lines for the fetch stage, Qdrant points after that
+class StageStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.points = 0
+        self.errors = 0
+        self.skipped = 0
+        self.busy_seconds = 0.0
+        self._lock = Lock()
+
+    def record(self, items: int = 0, points: int = 0, errors: int = 0, skipped: int = 0, seconds: float = 0.0):
+        with self._lock:
+            self.items += items
+            self.points += points
+            self.errors += errors
+            self.skipped += skipped
+            self.busy_seconds += seconds
+
+    def line(self, elapsed: float) -> str:
+        with self._lock:
+            rate = self.points / elapsed if elapsed else 0.0
+            return (f"{self.name}: {self.items} items, {self.points} points ({rate:.0f}/s), "
+                    f"{self.errors} errors, {self.skipped} skipped, busy {self.busy_seconds:.1f}s")
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {"items": self.items, "points": self.points, "errors": self.errors, "skipped": self.skipped,
+                    "busy_seconds": round(self.busy_seconds, 2)}
+
+
+def parse_block(lines: list, rerank_payload: bool) -> tuple:
+    # Top-level so it can run in a process pool
+    # -> (points, docs without an embedding, malformed lines)
+    points, unembedded, malformed = [], [], 0
+    for line in lines:
         try:
             doc = json.loads(line)
-        except json.JSONDecodeError:
+            point = doc_to_point(doc, rerank_payload)
+        except MALFORMED_DOC_ERRORS:
+            malformed += 1
             continue
-        # skip if no embedding
-        embedding = doc.get("embedding")
-        if not embedding:
+        if point is not None:
+            points.append(point)
+        else:
+            unembedded.append(doc)
+    return points, unembedded, malformed
+
+
+# Qdrant applies a shard's updates in order, so once a wait=True operation
+# returns every earlier wait=False upsert on that shard has been applied as
+# well. A delete by id would only reach the shard owning that id; a delete by
+# filter goes to every shard, so this no-op one is a barrier for all of them.
+def update_barrier():
+    qdrant.delete(
+        collection_name=QDRANT_COLLECTION,
+        points_selector=rest.FilterSelector(filter=rest.Filter(
+            must=[rest.HasIdCondition(has_id=[str(uuid.UUID(int=0))])],
+        )),
+        wait=True,
+    )
+
+
+def _fetch_worker(batches: queue.Queue, parse_q: queue.Queue, stats: StageStats, checkpoint: MigrationCheckpoint):
+    def emit(batch_num, block_num, block, started, complete=True):
+        # The batch still has to be streamed up to its missing chunks, but done
+        # chunks are neither parsed nor written again
+        if checkpoint.chunk_done(batch_num, block_num):
+            return
+        stats.record(items=1, points=len(block), seconds=time.perf_counter() - started)
+        parse_q.put((batch_num, block_num, block, complete))     # blocks while parsers are behind
+
+    while True:
+        try:
+            batch_num = batches.get_nowait()
+        except queue.Empty:
+            return
+        if checkpoint.batch_done(batch_num):
+            logger.info(f"Skipping batch {batch_num}, already complete")
             continue
+        endpoint = f"{STREAMING_ENDPOINT_BASE}/{batch_num}"
+        logger.info(f"Fetching batch {batch_num} from {endpoint}")
+        block, block_num = [], 0
+        started = time.perf_counter()
+        try:
+            with requests.get(endpoint, stream=True, timeout=600) as resp:
+                resp.raise_for_status()
+                for line in iter_ndjson_lines(resp):
+                    block.append(line)
+                    if len(block) >= UPSERT_CHUNK_SIZE:
+                        block_num += 1
+                        emit(batch_num, block_num, block, started)
+                        block = []
+                        started = time.perf_counter()
+            if block:
+                block_num += 1
+                emit(batch_num, block_num, block, started)
+            # Only a cleanly finished stream tells how many chunks the batch has
+            checkpoint.set_chunk_count(batch_num, block_num)
+        except Exception as e:
+            # The tail of the batch is unknown, so it stays incomplete for `resume`
+            logger.error(f"Error fetching/decompressing batch {batch_num}: {e}")
+            stats.record(errors=1)
+            # The lines read before the error are still written, but their
+            # chunk is cut short, so it is never checkpointed and `resume` redoes it
+            if block:
+                block_num += 1
+                emit(batch_num, block_num, block, started, complete=False)
 
-        point = rest.PointStruct(
-            id=str(uuid.uuid4()),    # Qdrant can accept string IDs
-            vector=embedding,
-            payload={
-                "mongo_id": str(doc["_id"]),
-                "yearsOfWorkExperience": int(doc.get("yearsOfWorkExperience", 0)),
-                "prestigeScore": float(doc.get("prestigeScore", 0)),
-                "country": str(doc.get("country", "")),
-            },
-        )
-        points.append(point)
 
-    print(f"batch no : {batch_num} -> total points to upsert: {len(points)}")
+def _parse_worker(parse_q: queue.Queue, upsert_q: queue.Queue, embed_q, stats: StageStats,
+                  checkpoint: MigrationCheckpoint, process_pool=None):
+    while True:
+        item = parse_q.get()
+        if item is None:
+            return
+        batch_num, block_num, lines, complete = item
+        started = time.perf_counter()
+        if process_pool is not None:
+            points, unembedded, malformed = process_pool.submit(parse_block, lines, STORE_RERANK_PAYLOAD).result()
+        else:
+            points, unembedded, malformed = parse_block(lines, STORE_RERANK_PAYLOAD)
+        if malformed:
+            logger.warning(f"Skipped {malformed} malformed line(s) in batch {batch_num} (block {block_num})")
+        skipped = len(unembedded) if embed_q is None else 0
+        stats.record(items=1, points=len(points), errors=malformed, skipped=skipped,
+                     seconds=time.perf_counter() - started)
+        if unembedded and embed_q is not None:
+            embed_q.put((batch_num, block_num, points, unembedded, complete))
+        elif points:
+            upsert_q.put((batch_num, block_num, points, complete))
+        elif complete:
+            checkpoint.mark_chunk(batch_num, block_num)
 
-    if not points:
-        logger.info(f"No valid points in batch {batch_num}")
-        return 0
 
-    BATCH_SIZE = 500
-    total_upserted = 0
+def _embed_group(group: list, upsert_q: queue.Queue, stats: StageStats, checkpoint: MigrationCheckpoint,
+                 embedder: Embedder):
+    docs = [doc for _, _, _, unembedded, _ in group for doc in unembedded]
+    texts = [embedding_text(doc) for doc in docs]
+    started = time.perf_counter()
+    try:
+        vectors = embed_with_retries(embedder, [text for text in texts if text], input_type="document")
+    except Exception as e:
+        logger.error(f"Embedding {len(docs)} docs failed after retries: {e}")
+        vectors = None
+    embedded = 0
+    if vectors is not None:
+        vectors = iter(vectors)
+        for doc, text in zip(docs, texts):
+            if text:
+                doc["embedding"] = next(vectors)
+                embedded += 1
+
+    malformed = 0
+    for batch_num, block_num, points, unembedded, complete in group:
+        # A block whose embeddings failed is written without them but not
+        # checkpointed, so `resume` retries it
+        complete = complete and vectors is not None
+        points = list(points)
+        block_malformed = 0
+        for doc in unembedded:
+            try:
+                point = doc_to_point(doc, STORE_RERANK_PAYLOAD)
+            except MALFORMED_DOC_ERRORS:
+                block_malformed += 1
+                continue
+            if point is not None:
+                points.append(point)
+        if block_malformed:
+            logger.warning(f"Skipped {block_malformed} malformed doc(s) in batch {batch_num} (block {block_num})")
+            malformed += block_malformed
+        if points:
+            upsert_q.put((batch_num, block_num, points, complete))
+        elif complete:
+            checkpoint.mark_chunk(batch_num, block_num)
+    stats.record(items=1, points=embedded, errors=int(vectors is None) + malformed, skipped=len(docs) - embedded,
+                 seconds=time.perf_counter() - started)
+
 
-    # Split points into chunks of 500 and upsert each chunk separately
-    for i in range(0, len(points), BATCH_SIZE):
-        chunk = points[i : i + BATCH_SIZE]
+def _embed_worker(embed_q: queue.Queue, upsert_q: queue.Queue, stats: StageStats, checkpoint: MigrationCheckpoint,
+                  embedder: Embedder, concurrency: int):
+    in_flight = threading.BoundedSemaphore(concurrency)
+    group, group_docs = [], 0
 
-        for attempt in range(MAX_RETRIES):
+    def done(future):
+        in_flight.release()
+        # Nothing else reads the future, so a failed group must be reported here
+        if future.exception() is not None:
+            logger.error("Embed group failed, its blocks were not written", exc_info=future.exception())
+            stats.record(errors=1)
+
+    def submit(group):
+        in_flight.acquire()     # blocks (and so backs up embed_q) while Voyage is saturated
+        future = pool.submit(_embed_group, group, upsert_q, stats, checkpoint, embedder)
+        future.add_done_callback(done)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as pool:
+        while True:
             try:
-                qdrant.upsert(
-                    collection_name=QDRANT_COLLECTION,
-                    wait=True,
-                    points=chunk,
-                )
-                logger.info(f"Upserted {len(chunk)} points from batch {batch_num} (chunk {i//BATCH_SIZE + 1})")
-                total_upserted += len(chunk)
-                break
-            except Exception as e:
-                logger.error(f"Upsert error (batch {batch_num}, chunk {i//BATCH_SIZE + 1}, attempt {attempt+1}): {e}")
-                time.sleep(2 ** attempt)
+                item = embed_q.get(timeout=EMBED_MAX_WAIT)
+            except queue.Empty:
+                item = False
+            if item:
+                group.append(item)
+                group_docs += len(item[3])
+            # Send a full group, or whatever is waiting once the queue goes quiet or ends
+            if group and (group_docs >= EMBED_BATCH_DOCS or not item):
+                submit(group)
+                group, group_docs = [], 0
+            if item is None:
+                return
+
+
+def _upsert_worker(upsert_q: queue.Queue, stats: StageStats, checkpoint: MigrationCheckpoint,
+                   snapshot: IndexWriter, write_qdrant: bool):
+    writes = 0
+    while True:
+        item = upsert_q.get()
+        if item is None:
+            return
+        batch_num, chunk_num, points, complete = item
+        writes += 1
+        started = time.perf_counter()
+        if snapshot is not None:
+            snapshot.add([point.vector for point in points], [point.payload for point in points])
+        if write_qdrant:
+            count = upsert_chunk(points, batch_num, chunk_num, wait=writes % UPSERT_BARRIER_EVERY == 0)
         else:
-            logger.error(f"Failed to upsert chunk {i//BATCH_SIZE + 1} of batch {batch_num} after {MAX_RETRIES} attempts")
+            count = len(points)
+        stats.record(items=1, points=count, errors=int(count == 0), seconds=time.perf_counter() - started)
+        if count and complete:
+            checkpoint.mark_chunk(batch_num, chunk_num)
 
-    return total_upserted
+
+def _run_stage(name: str, count: int, target, *args) -> list:
+    threads = [threading.Thread(target=target, args=args, name=f"{name}-{i}", daemon=True) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def run_pipeline(batch_nums: list, fetch_workers: int = FETCH_WORKERS, parse_workers: int = PARSE_WORKERS,
+                 upsert_workers: int = UPSERT_WORKERS, parse_in_processes: bool = PARSE_IN_PROCESSES,
+                 checkpoint: MigrationCheckpoint = None, embedder: Embedder = None,
+                 embed_concurrency: int = EMBED_CONCURRENCY, snapshot: IndexWriter = None,
+                 write_qdrant: bool = True) -> dict:
+    # Without an embedder, docs lacking an embedding are skipped (and counted)
+    checkpoint = checkpoint or MigrationCheckpoint()
+    batches = queue.Queue()
+    for batch_num in batch_nums:
+        batches.put(batch_num)
+    parse_q = queue.Queue(maxsize=PARSE_QUEUE_SIZE)
+    upsert_q = queue.Queue(maxsize=UPSERT_QUEUE_SIZE)
+    embed_q = queue.Queue(maxsize=EMBED_QUEUE_SIZE) if embedder is not None else None
+    stats = {name: StageStats(name) for name in ("fetch", "parse", "embed", "upsert")}
+    # Pool workers start lazily, once the stage threads are already running;
+    # forking a multi-threaded process can deadlock, so they are spawned
+    process_pool = None
+    if parse_in_processes:
+        process_pool = concurrent.futures.ProcessPoolExecutor(max_workers=parse_workers,
+                                                              mp_context=multiprocessing.get_context("spawn"))
+
+    started = time.perf_counter()
+    done = threading.Event()
+
+    def report():
+        while not done.wait(STATS_INTERVAL):
+            elapsed = time.perf_counter() - started
+            logger.info(" | ".join(s.line(elapsed) for s in stats.values())
+                        + f" | queued parse={parse_q.qsize()} upsert={upsert_q.qsize()}")
+
+    threading.Thread(target=report, name="stats", daemon=True).start()
+    try:
+        fetchers = _run_stage("fetch", fetch_workers, _fetch_worker, batches, parse_q, stats["fetch"], checkpoint)
+        parsers = _run_stage("parse", parse_workers, _parse_worker, parse_q, upsert_q, embed_q, stats["parse"],
+                             checkpoint, process_pool)
+        embedders = []
+        if embed_q is not None:
+            embedders = _run_stage("embed", 1, _embed_worker, embed_q, upsert_q, stats["embed"], checkpoint, embedder,
+                                   embed_concurrency)
+        upserters = _run_stage("upsert", upsert_workers, _upsert_worker, upsert_q, stats["upsert"], checkpoint,
+                               snapshot, write_qdrant)
+        # Drain stage by stage: a stage gets one sentinel per worker once its producers are done
+        for thread in fetchers:
+            thread.join()
+        for _ in parsers:
+            parse_q.put(None)
+        for thread in parsers:
+            thread.join()
+        for thread in embedders:
+            embed_q.put(None)
+            thread.join()
+        for _ in upserters:
+            upsert_q.put(None)
+        for thread in upserters:
+            thread.join()
+        if write_qdrant:
+            update_barrier()
+    finally:
+        done.set()
+        if process_pool is not None:
+            process_pool.shutdown()
+
+    elapsed = time.perf_counter() - started
+    for stage in stats.values():
+        logger.info(stage.line(elapsed))
+    upserted = stats["upsert"].points
+    skipped = stats["parse"].skipped + stats["embed"].skipped
+    logger.info(f"Pipeline finished in {elapsed:.1f}s: {upserted} docs upserted "
+                f"({upserted / elapsed if elapsed else 0.0:.0f} docs/s), {stats['embed'].points} embedded, "
+                f"{skipped} skipped without an embedding; checkpoint: {checkpoint.summary()}")
+    return {name: stage.to_dict() for name, stage in stats.items()}
 
 
 def delete_collection():
@@ -125,24 +614,104 @@ def delete_collection():
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Migrate resumes to Qdrant")
-    parser.add_argument("action", choices=["delete", "migrate"], nargs="?", default="migrate")
+    parser.add_argument("action", choices=["delete", "migrate", "resume", "index", "tune", "snapshot"], nargs="?", default="migrate")
+    parser.add_argument("--rerank-payload", action="store_true", help="Store compact re-rank fields in the payload")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default=COLLECTION_PROFILE,
+                        help="Collection profile for a new collection (or for `tune`)")
+    parser.add_argument("--serial", action="store_true",
+                        help="One worker per batch doing fetch, parse and upsert in turn (no checkpoints)")
+    parser.add_argument("--fetch-workers", type=int, default=FETCH_WORKERS)
+    parser.add_argument("--parse-workers", type=int, default=PARSE_WORKERS)
+    parser.add_argument("--parse-processes", action="store_true", default=PARSE_IN_PROCESSES,
+                        help="Parse in a process pool instead of threads")
+    parser.add_argument("--upsert-workers", type=int, default=UPSERT_WORKERS)
+    parser.add_argument("--no-embed", action="store_true", help="Skip docs without an embedding instead of embedding them")
+    parser.add_argument("--embed-concurrency", type=int, default=EMBED_CONCURRENCY)
+    parser.add_argument("--stub-embeddings", action="store_true",
+                        help="Embed with the offline StubVoyageClient (testing only)")
+    parser.add_argument("--snapshot", default=None,
+                        help="Also write a local snapshot to this directory (required for the `snapshot` action)")
+    parser.add_argument("--snapshot-dtype", choices=["float32", "float16"], default=SNAPSHOT_DTYPE)
+    parser.add_argument("--snapshot-ivf-lists", type=int, default=0, help="Train IVF lists on the snapshot (0 = exact only)")
     args = parser.parse_args()
+    STORE_RERANK_PAYLOAD = STORE_RERANK_PAYLOAD or args.rerank_payload
+    if args.action == "resume" and args.serial:
+        parser.error("resume needs the pipeline's checkpoints; --serial doesn't keep any")
+    if args.snapshot and (args.action == "resume" or args.serial):
+        parser.error("--snapshot needs a complete pipeline run (migrate or snapshot, without --serial)")
+    if args.action == "snapshot" and not args.snapshot:
+        parser.error("the snapshot action needs --snapshot DIR")
 
     if args.action == "delete":
         delete_collection()
+        MigrationCheckpoint().clear()
+        exit(0)
+
+    if args.action == "index":
+        ensure_payload_indexes()
         exit(0)
 
-    ensure_collection()
+    if args.action == "tune":
+        apply_profile(qdrant, QDRANT_COLLECTION, get_profile(args.profile))
+        logger.info(f"Applied profile '{args.profile}' to '{QDRANT_COLLECTION}'")
+        exit(0)
+
+    # snapshot: stream the corpus into local files only, Qdrant is not touched
+    write_qdrant = args.action != "snapshot"
+    if write_qdrant:
+        ensure_collection(args.profile)
     batch_nums = list(range(TOTAL_BATCHES))
-    total = 0
-    lock = Lock()
-
-    with concurrent.futures.ThreadPoolExecutor(max_workers=NUM_THREADS) as pool:
-        futures = [pool.submit(fetch_and_upsert_batch, bn) for bn in batch_nums]
-        for f in concurrent.futures.as_completed(futures):
-            count = f.result() or 0
-            with lock:
-                total += count
-            logger.info(f"Total upserted so far: {total}")
+    embedder = None
+    if EMBED_MISSING and not args.no_embed:
+        client = StubVoyageClient() if args.stub_embeddings else voyageai.Client(api_key=VOYAGE_API_KEY)
+        embedder = Embedder(client)
+    snapshot = IndexWriter(args.snapshot, dtype=args.snapshot_dtype) if args.snapshot else None
+    checkpoint = MigrationCheckpoint() if write_qdrant else MigrationCheckpoint(path=None)
+    if args.action in ("migrate", "snapshot"):
+        # A fresh load; point ids are deterministic, so existing points are overwritten
+        checkpoint.clear()
+    else:
+        logger.info(f"Resuming from {CHECKPOINT_PATH}: {checkpoint.summary()}")
+
+    if args.serial:
+        total = 0
+        lock = Lock()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=NUM_THREADS) as pool:
+            futures = [pool.submit(fetch_and_upsert_batch, bn) for bn in batch_nums]
+            for f in concurrent.futures.as_completed(futures):
+                count = f.result() or 0
+                with lock:
+                    total += count
+                logger.info(f"Total upserted so far: {total}")
+    else:
+        stage_stats = run_pipeline(
+            batch_nums,
+            fetch_workers=args.fetch_workers,
+            parse_workers=args.parse_workers,
+            upsert_workers=args.upsert_workers,
+            parse_in_processes=args.parse_processes,
+            checkpoint=checkpoint,
+            embedder=embedder,
+            embed_concurrency=args.embed_concurrency,
+            snapshot=snapshot,
+            write_qdrant=write_qdrant,
+        )
+        total = stage_stats["upsert"]["points"]
+
+    if snapshot is not None:
+        # A failed fetch or write leaves holes in the corpus; the snapshot has
+        # no checkpoint to resume from, so don't publish an incomplete one
+        failed = {stage: stage_stats[stage]["errors"] for stage in ("fetch", "upsert") if stage_stats[stage]["errors"]}
+        if failed:
+            logger.error(f"Not finalizing the snapshot in {args.snapshot}: {failed} errors; rerun the migration")
+            exit(1)
+        index = snapshot.finalize(ivf_lists=args.snapshot_ivf_lists)
+        logger.info(f"Snapshot of {len(index)} vectors written to {args.snapshot} "
+                    f"(serve it with init.RETRIEVAL_BACKEND = \"local\")")
+    if write_qdrant:
+        # bulk-load: the graph is only built now, once, over the whole corpus
+        # (also when an earlier bulk-load run crashed and this one is a plain resume)
+        if finish_bulk_load(qdrant, QDRANT_COLLECTION, get_profile(args.profile)):
+            logger.info(f"Bulk load finished, building the HNSW graph of '{QDRANT_COLLECTION}'")
 
     logger.info(f"Migration complete. Total points upserted: {total}")
@@ -0,0 +1,81 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+
+# ==== ASYNC STAGE GRAPH ====
+# Each stage is an async function whose keyword arguments are named after the
+# stages (or graph inputs) it depends on. Stages start as soon as all of their
+# dependencies have resolved, so independent stages run concurrently.
+
+@dataclass
+class Stage:
+    name: str
+    fn: Callable[..., Awaitable]
+    deps: List[str] = field(default_factory=list)
+
+
+class StageGraph:
+    def __init__(self, inputs: List[str] = None):
+        self.inputs = list(inputs or [])
+        self._stages: Dict[str, Stage] = {}
+
+    def add(self, name: str, fn: Callable[..., Awaitable], deps: List[str] = ()):
+        if name in self._stages or name in self.inputs:
+            raise ValueError(f"Stage '{name}' already defined")
+        for dep in deps:
+            # Dependencies must be declared first, which also rules out cycles
+            if dep not in self._stages and dep not in self.inputs:
+                raise ValueError(f"Stage '{name}' depends on unknown stage '{dep}'")
+        self._stages[name] = Stage(name=name, fn=fn, deps=list(deps))
+        return self
+
+    def replace(self, name: str, fn: Callable[..., Awaitable]):
+        # Swap the implementation of an existing stage, keeping its dependencies
+        if name not in self._stages:
+            raise KeyError(f"Unknown stage '{name}'")
+        graph = StageGraph(self.inputs)
+        for other in self._stages.values():
+            graph.add(other.name, fn if other.name == name else other.fn, other.deps)
+        return graph
+
+    @property
+    def stages(self) -> List[str]:
+        return list(self._stages)
+
+    async def run(self, **inputs) -> Tuple[dict, dict]:
+        missing = [name for name in self.inputs if name not in inputs]
+        if missing:
+            raise ValueError(f"Missing graph inputs: {missing}")
+
+        timings = {}
+        tasks: Dict[str, asyncio.Future] = {}
+        for name, value in inputs.items():
+            resolved = asyncio.get_running_loop().create_future()
+            resolved.set_result(value)
+            tasks[name] = resolved
+
+        async def run_stage(stage: Stage):
+            dep_values = await asyncio.gather(*(tasks[dep] for dep in stage.deps))
+            start = time.perf_counter()
+            try:
+                return await stage.fn(**dict(zip(stage.deps, dep_values)))
+            finally:
+                timings[stage.name] = time.perf_counter() - start
+
+        # Stages were added in dependency order, so every dep task exists already
+        for stage in self._stages.values():
+            tasks[stage.name] = asyncio.ensure_future(run_stage(stage))
+
+        stage_tasks = [tasks[name] for name in self._stages]
+        try:
+            await asyncio.gather(*stage_tasks)
+        except BaseException:
+            for task in stage_tasks:
+                task.cancel()
+            await asyncio.gather(*stage_tasks, return_exceptions=True)
+            raise
+
+        results = {name: tasks[name].result() for name in self._stages}
+        return results, timings
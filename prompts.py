@@ -284,9 +284,9 @@ Now, convert the following user query into structured search criteria(having bot
 # ++++++ GEMINI ++++++
 
 # ++++++ Perplexity ++++++
-def get_re_ranking_prompt(query: str, candidate_profiles: list) -> str:
-    candidate_profiles_str = "\n\n".join(candidate_profiles)
-    return (
+# Ranking rules shared by every re-ranking prompt variant below, so the fast
+# scoring mode and the explanation call judge exactly like the full prompt
+RE_RANKING_RULES = (
         "MANDATORY RE-RANKING & CONSTRAINT CHECKING SYSTEM\n"
         "You MUST rank candidate profiles against the user query STRICTLY as follows.\n\n"
         "== PHASE 1: HARD CONSTRAINTS (MANDATORY, PASS/FAIL) ==\n"
@@ -311,6 +311,13 @@ def get_re_ranking_prompt(query: str, candidate_profiles: list) -> str:
         "== DEPRIORITIZATION RULES ==\n"
         "- NEVER assign a high score to a candidate from a top institution or employer if it is not in the country of interest.\n"
         "- If the candidate's experience is not in the exact required field, deprioritize appropriately even if all hard criteria are met.\n\n"
+)
+
+
+def get_re_ranking_prompt(query: str, candidate_profiles: list) -> str:
+    candidate_profiles_str = "\n\n".join(candidate_profiles)
+    return (
+        RE_RANKING_RULES +
         "== OUTPUT FORMAT & EXPLANATION REQUIREMENT ==\n"
         f"User Query:\n{query}\n\n"
         f"Candidate Profiles:\n{candidate_profiles_str}\n\n"
@@ -343,6 +350,46 @@ def get_re_ranking_prompt(query: str, candidate_profiles: list) -> str:
         }
         '''
     )
+
+
+# Fast scoring: same rules, but only ids and scores are generated. With
+# failure codes each candidate also lists the hard constraints it failed.
+FAILED_CONSTRAINT_CODES = ["degree", "role", "country", "top_institution", "other"]
+
+
+def get_fast_re_ranking_prompt(query: str, candidate_profiles: list, with_failure_codes: bool = False) -> str:
+    candidate_profiles_str = "\n\n".join(candidate_profiles)
+    prompt = (
+        RE_RANKING_RULES +
+        "== OUTPUT FORMAT (SCORES ONLY) ==\n"
+        f"User Query:\n{query}\n\n"
+        f"Candidate Profiles:\n{candidate_profiles_str}\n\n"
+        "Apply both phases to every candidate but DO NOT write any explanation. "
+        f"Return all {len(candidate_profiles)} profiles, each with only its _id (kept exactly intact) and ranking_score"
+    )
+    if with_failure_codes:
+        prompt += (
+            ", plus failed_constraints: the codes of the hard constraints it failed, from "
+            f"{FAILED_CONSTRAINT_CODES} (empty list if all passed)"
+        )
+    return prompt + ".\n"
+
+
+# On-demand explanations for candidates that were already scored: the model
+# audits each given score instead of producing a new one.
+def get_explanation_prompt(query: str, scored_candidate_profiles: list) -> str:
+    candidate_profiles_str = "\n\n".join(scored_candidate_profiles)
+    return (
+        RE_RANKING_RULES +
+        "== TASK: EXPLAIN EXISTING SCORES ==\n"
+        "Each candidate below was already scored with the rules above; its ranking_score is included. "
+        "Do NOT change the scores. For each candidate, clearly list:\n"
+        "- Which hard constraints were PASSED, which were FAILED (use explicit checklist)\n"
+        "- A detailed_reason_for_ranking that accounts for BOTH constraint checking and soft criteria and justifies the given score.\n\n"
+        f"User Query:\n{query}\n\n"
+        f"Candidate Profiles:\n{candidate_profiles_str}\n\n"
+        f"Return all {len(scored_candidate_profiles)} profiles, keeping every _id exactly intact.\n"
+    )
 # ++++++ Perplexity ++++++
 
 FILTER_EXTRACTION_PROMPT = (
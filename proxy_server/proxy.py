@@ -1,19 +1,70 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-import httpx, time, uuid, heapq
-from threading import Lock, Thread
+import asyncio, hashlib, httpx, time, uuid, heapq, random, os
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from functools import partial
+from threading import Condition, Lock, Thread
 from concurrent.futures import Future
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import List
 import queue
 
 # --- Constants ---
 CLASSIFICATION_SERVER_URL = "http://localhost:8001/classify"
-MAX_BATCH = 5
+# "async": requests await asyncio futures resolved by dispatcher coroutines;
+# "threads": the thread-based fallback (one blocked threadpool thread per request)
+PROXY_MODE = os.environ.get("PROXY_MODE", "async")
+REQUEST_TIMEOUT = 30.0
+MAX_BATCH = int(os.environ.get("MAX_BATCH", 5))  # most sequences per batch
+MAX_BATCH_WAIT = float(os.environ.get("MAX_BATCH_WAIT", 0.01))  # seconds a partial batch is held open for more requests
+# Batching policy, per deployment:
+#   "longest":      the MAX_BATCH longest queued sequences
+#   "token_budget": longest first, as many as fit MAX_BATCH_TOKENS once padded to the longest
+#   "bucketed":     token_budget, but only sequences in the longest one's LENGTH_BUCKETS bucket
+BATCH_POLICY = os.environ.get("BATCH_POLICY", "longest")
+MAX_BATCH_TOKENS = int(os.environ.get("MAX_BATCH_TOKENS", 4096))
+LENGTH_BUCKETS = [int(b) for b in os.environ.get("LENGTH_BUCKETS", "32,64,128,256,512,1024").split(",")]
+CHARS_PER_TOKEN = 4  # rough token estimate for the classifier's tokenizer
+# Requests queued longer than this are batched before any newer ones, so a
+# steady stream of longer requests can't starve short ones
+MAX_QUEUE_DELAY = float(os.environ.get("MAX_QUEUE_DELAY", 0.5))
+DISPATCHERS = 16  # dispatcher threads = most batches that can ever be in flight
+MIN_CONCURRENCY = 1
+INITIAL_CONCURRENCY = 2
+MAX_CONCURRENCY = DISPATCHERS
+AIMD_DECREASE = 0.5  # limit multiplier on a 429
+OVERLOAD_PAUSE = 0.05  # max jittered pause before retrying a 429 (plus Retry-After)
+MAX_ATTEMPTS = 3  # per batch, for errors other than 429
+MAX_OVERLOAD_RETRIES = 10
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", 10000))  # results kept; 0 disables the cache
+RESULT_CACHE_TTL = float(os.environ.get("RESULT_CACHE_TTL", 3600))  # seconds a cached result stays valid
+
+# Async mode: the dispatcher coroutines (see async_classification_worker) run
+# for the app's lifetime; on shutdown they are cancelled and the upstream
+# client's connections closed
+dispatcher_tasks = []
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if PROXY_MODE == "async":
+        dispatcher_tasks.extend(
+            asyncio.create_task(async_classification_worker(), name=f"dispatcher-{i}") for i in range(DISPATCHERS)
+        )
+    try:
+        yield
+    finally:
+        for task in dispatcher_tasks:
+            task.cancel()
+        await asyncio.gather(*dispatcher_tasks, return_exceptions=True)
+        dispatcher_tasks.clear()
+        if PROXY_MODE == "async":
+            await client.aclose()
 
 app = FastAPI(
     title="Priority-Queue Based Classification Proxy",
-    description="Batches and prioritizes longest requests"
+    description="Batches and prioritizes longest requests",
+    lifespan=lifespan,
 )
 
 class ProxyRequest(BaseModel):
@@ -27,92 +78,619 @@ class PrioritizedItem:
     priority: int  # negative length: max-heap
     id: str
     sequence: str
-    future: Future
+    future: Future  # concurrent.futures.Future, or asyncio.Future in async mode
+    enqueued_at: float = field(default_factory=time.monotonic, compare=False)
+    taken: bool = field(default=False, compare=False)  # batched (see PriorityQueue)
+
+# --- Batching policies ---
+# Sequences leave the heap longest first, so a policy only decides how many of
+# the longest queued items make up the next batch (take) and how many it could
+# hold at most given the longest one (capacity); a batch is held open until
+# it reaches capacity or its wait is over.
+def sequence_tokens(sequence: str) -> int:
+    return len(sequence) // CHARS_PER_TOKEN + 1
+
+class LongestPolicy:
+    def __init__(self, max_items: int):
+        self.max_items = max_items
+
+    def capacity(self, items: List[PrioritizedItem]) -> int:
+        return self.max_items
+
+    def take(self, items: List[PrioritizedItem]) -> int:
+        return min(self.capacity(items), len(items))
+
+class TokenBudgetPolicy(LongestPolicy):
+    # Upstream cost tracks the padded size (count x longest), so cap that
+    def __init__(self, max_items: int, max_tokens: int):
+        super().__init__(max_items)
+        self.max_tokens = max_tokens
+
+    def capacity(self, items: List[PrioritizedItem]) -> int:
+        return max(1, min(self.max_items, self.max_tokens // sequence_tokens(items[0].sequence)))
+
+class LengthBucketPolicy(TokenBudgetPolicy):
+    # Similar lengths only, so short sequences aren't padded to a long one
+    def __init__(self, max_items: int, max_tokens: int, buckets: List[int]):
+        super().__init__(max_items, max_tokens)
+        self.buckets = sorted(buckets)
+
+    def bucket(self, item: PrioritizedItem) -> int:
+        tokens = sequence_tokens(item.sequence)
+        return next((i for i, bound in enumerate(self.buckets) if tokens <= bound), len(self.buckets))
+
+    def take(self, items: List[PrioritizedItem]) -> int:
+        count = super().take(items)
+        longest = self.bucket(items[0])
+        same = 1
+        while same < count and self.bucket(items[same]) == longest:
+            same += 1
+        return same
+
+def make_policy(name: str):
+    if name == "longest":
+        return LongestPolicy(MAX_BATCH)
+    if name == "token_budget":
+        return TokenBudgetPolicy(MAX_BATCH, MAX_BATCH_TOKENS)
+    if name == "bucketed":
+        return LengthBucketPolicy(MAX_BATCH, MAX_BATCH_TOKENS, LENGTH_BUCKETS)
+    raise ValueError(f"Unknown BATCH_POLICY '{name}', expected longest, token_budget or bucketed")
 
 # --- Thread-safe max-heap priority queue ---
+# Items sit both in the heap (priority order) and in _arrivals (arrival
+# order). Normally batches come off the heap; once the oldest request is
+# overdue (MAX_QUEUE_DELAY) batches come off _arrivals instead, oldest first,
+# so a steady stream of longer requests can't starve short ones. An item
+# taken through one structure is flagged and stays in the other until it
+# reaches the front there (or the structure is compacted), so no operation
+# scans the whole queue.
 class PriorityQueue:
-    def __init__(self):
+    def __init__(self, policy):
+        self.policy = policy
         self._heap: List[PrioritizedItem] = []
+        self._arrivals = deque()
+        self._size = 0  # live items (the structures also hold taken ones)
         self._lock = Lock()
+        # Idle dispatchers wait on _not_empty; the one dispatcher currently
+        # holding a batch open (_collecting) waits on _grown
+        self._not_empty = Condition(self._lock)
+        self._grown = Condition(self._lock)
+        self._collecting = False
+        self.batches = 0
+        self.batched_items = 0
+        self.padded_tokens = 0
+
+    def _add(self, item: PrioritizedItem):
+        heapq.heappush(self._heap, item)
+        self._arrivals.append(item)
+        self._size += 1
 
     def push(self, item: PrioritizedItem):
         with self._lock:
+            self._add(item)
+            if self._collecting:
+                self._grown.notify()
+            else:
+                self._not_empty.notify()
+
+    def _oldest(self) -> PrioritizedItem:
+        while self._arrivals[0].taken:
+            self._arrivals.popleft()
+        return self._arrivals[0]
+
+    def _top(self, n: int) -> List[PrioritizedItem]:
+        # The n highest priority live items, in order, in O(n log size);
+        # taken items met on the way are dropped for good
+        top = []
+        while self._heap and len(top) < n:
+            item = heapq.heappop(self._heap)
+            if not item.taken:
+                top.append(item)
+        for item in top:
             heapq.heappush(self._heap, item)
+        return top
 
-    def pop_n(self, n: int) -> List[PrioritizedItem]:
+    def _overdue(self, oldest: PrioritizedItem) -> List[PrioritizedItem]:
+        # Overdue requests in arrival order, as many as the policy lets share
+        # a batch with the oldest one
+        now = time.monotonic()
+        batch = [oldest]
+        for item in self._arrivals:
+            if len(batch) >= self.policy.max_items or now - item.enqueued_at <= MAX_QUEUE_DELAY:
+                break
+            if item.taken or item is oldest:
+                continue
+            trial = sorted(batch + [item])
+            if self.policy.take(trial) < len(trial):
+                break
+            batch.append(item)
+        return sorted(batch)
+
+    def _take(self) -> tuple:
+        # -> (next batch, longest first; whether the policy could take more)
+        oldest = self._oldest()
+        if time.monotonic() - oldest.enqueued_at > MAX_QUEUE_DELAY:
+            return self._overdue(oldest), True
+        top = self._top(self.policy.max_items)
+        count = self.policy.take(top)
+        return top[:count], count >= self.policy.capacity(top)
+
+    def _pop(self, batch: List[PrioritizedItem]) -> List[PrioritizedItem]:
+        for item in batch:
+            item.taken = True
+        self._size -= len(batch)
+        while self._heap and self._heap[0].taken:
+            heapq.heappop(self._heap)
+        while self._arrivals and self._arrivals[0].taken:
+            self._arrivals.popleft()
+        # Taken items stuck behind live ones: rebuild once they outnumber the
+        # live items, which keeps this O(1) amortized
+        if len(self._heap) > 2 * self._size + 64:
+            self._heap = [item for item in self._heap if not item.taken]
+            heapq.heapify(self._heap)
+        if len(self._arrivals) > 2 * self._size + 64:
+            self._arrivals = deque(item for item in self._arrivals if not item.taken)
+        self.batches += 1
+        self.batched_items += len(batch)
+        self.padded_tokens += len(batch) * sequence_tokens(batch[0].sequence)
+        return batch
+
+    def pop_batch(self, max_wait: float) -> List[PrioritizedItem]:
+        # Sleeps until a request arrives, then holds the batch open until the
+        # policy's batch is full or the oldest request has waited max_wait.
+        # Only one dispatcher collects at a time, so concurrent dispatchers
+        # don't split the arrivals into many small batches.
+        with self._lock:
+            while not self._size or self._collecting:
+                self._not_empty.wait()
+            self._collecting = True
+            deadline = self._oldest().enqueued_at + max_wait
+            batch, full = self._take()
+            while not full:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._grown.wait(remaining)
+                batch, full = self._take()
+            self._collecting = False
+            self._pop(batch)
+            if self._size:
+                # Leftovers: hand them to the next idle dispatcher
+                self._not_empty.notify()
+            return batch
+
+    def stats(self) -> dict:
         with self._lock:
-            items = []
-            for _ in range(min(n, len(self._heap))):
-                items.append(heapq.heappop(self._heap))
-            return items
+            return {
+                "batch_policy": type(self.policy).__name__,
+                "queued": self._size,
+                "batches": self.batches,
+                "avg_batch_size": round(self.batched_items / self.batches, 2) if self.batches else 0.0,
+                "avg_padded_tokens": round(self.padded_tokens / self.batches, 1) if self.batches else 0.0,
+            }
 
     def __len__(self):
         with self._lock:
-            return len(self._heap)
+            return self._size
+
+# --- Async variant: same heap, policy and stats, waited on by coroutines ---
+# Everything runs on the event loop thread, so the threading lock is never
+# contended; the asyncio conditions stand in for the thread ones. Requests
+# that timed out while queued (cancelled futures) are dropped, not sent.
+class AsyncPriorityQueue(PriorityQueue):
+    def __init__(self, policy):
+        super().__init__(policy)
+        self._async_lock = asyncio.Lock()
+        self._async_not_empty = asyncio.Condition(self._async_lock)
+        self._async_grown = asyncio.Condition(self._async_lock)
+
+    async def push(self, item: PrioritizedItem):
+        async with self._async_lock:
+            self._add(item)
+            if self._collecting:
+                self._async_grown.notify()
+            else:
+                self._async_not_empty.notify()
+
+    async def pop_batch(self, max_wait: float) -> List[PrioritizedItem]:
+        async with self._async_lock:
+            while True:
+                while not self._size or self._collecting:
+                    await self._async_not_empty.wait()
+                self._collecting = True
+                deadline = self._oldest().enqueued_at + max_wait
+                batch, full = self._take()
+                while not full:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        await asyncio.wait_for(self._async_grown.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        pass
+                    batch, full = self._take()
+                self._collecting = False
+                batch = [item for item in self._pop(batch) if not item.future.done()]
+                if self._size:
+                    self._async_not_empty.notify()
+                if batch:
+                    return batch
+
+# --- Adaptive (AIMD) limit on batches in flight upstream ---
+# A dispatcher holds a slot (acquire .. release) from before it seals a batch
+# until the batch is answered, retries included; in between, start/finish
+# bracket each request actually on the wire. Each successful request made at
+# the limit adds 1/limit (about +1 per round trip at full concurrency); a 429
+# multiplies the limit by AIMD_DECREASE, but only once per congestion event:
+# 429s for requests sent before the last cut don't cut again. Other errors
+# leave it alone.
+class AdaptiveLimiter:
+    def __init__(self, initial: int, minimum: int, maximum: int, decrease: float):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self._limit = float(initial)
+        self._cond = Condition()
+        self._last_decrease = 0.0
+        self.held = 0
+        self.in_flight = 0
+        self.successes = 0
+        self.overloads = 0
+        self.errors = 0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def acquire(self):
+        with self._cond:
+            while self.held >= int(self._limit):
+                self._cond.wait()
+            self.held += 1
+
+    def release(self):
+        with self._cond:
+            self.held -= 1
+            self._cond.notify_all()
+
+    def start(self) -> float:
+        # -> send time, to be passed back to finish()
+        with self._cond:
+            self.in_flight += 1
+            return time.monotonic()
+
+    def finish(self, outcome: str, sent_at: float):
+        # outcome: "success", "overload" (429) or "error"
+        with self._cond:
+            self._record(outcome, sent_at)
+            self._cond.notify_all()
+
+    def _record(self, outcome: str, sent_at: float):
+        # Only grow a limit that requests on the wire actually reached, so it
+        # can't drift far above real demand while traffic is light
+        saturated = self.in_flight >= int(self._limit)
+        self.in_flight -= 1
+        if outcome == "success":
+            self.successes += 1
+            if saturated:
+                self._limit = min(self.maximum, self._limit + 1 / self._limit)
+        elif outcome == "overload":
+            self.overloads += 1
+            if sent_at >= self._last_decrease:
+                self._limit = max(self.minimum, self._limit * self.decrease)
+                self._last_decrease = time.monotonic()
+        else:
+            self.errors += 1
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "concurrency_limit": int(self._limit),
+                "slots_held": self.held,
+                "in_flight": self.in_flight,
+                "successes": self.successes,
+                "overloads": self.overloads,
+                "errors": self.errors,
+            }
+
+class AsyncAdaptiveLimiter(AdaptiveLimiter):
+    def __init__(self, initial: int, minimum: int, maximum: int, decrease: float):
+        super().__init__(initial, minimum, maximum, decrease)
+        self._async_cond = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._async_cond:
+            await self._async_cond.wait_for(lambda: self.held < int(self._limit))
+            self.held += 1
+
+    async def release(self):
+        async with self._async_cond:
+            self.held -= 1
+            self._async_cond.notify_all()
+
+    def finish(self, outcome: str, sent_at: float):
+        # Waiters are only woken by release(): finish() can't await the condition
+        with self._cond:
+            self._record(outcome, sent_at)
+
+# --- Result cache: bounded LRU with a TTL, keyed by sequence hash ---
+def sequence_key(sequence: str) -> str:
+    return hashlib.sha256(sequence.encode("utf-8")).hexdigest()
+
+class ResultCache:
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, result)
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._entries[key]
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, result):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "cache_hits": self.hits,
+                "cache_misses": self.misses,
+                "cache_hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "cache_evictions": self.evictions,
+                "cache_expired": self.expired,
+                "cached_results": len(self._entries),
+            }
+
+# --- Coalescing: identical in-flight sequences share one queued item ---
+# The first request for a sequence queues it; later ones wait on its future
+# until it is done. Waiters are counted so the async path only cancels
+# (and thereby drops) a queued item once every request for it has given up.
+class InFlight:
+    def __init__(self):
+        self._futures = {}  # key -> future of the queued item
+        self._waiters = {}
+        self._lock = Lock()
+        self.coalesced = 0
+
+    def join(self, key: str, new_future) -> tuple:
+        # -> (future to wait on, whether new_future was registered and must be queued)
+        with self._lock:
+            fut = self._futures.get(key)
+            if fut is not None:
+                self._waiters[key] += 1
+                self.coalesced += 1
+                return fut, False
+            self._futures[key] = new_future
+            self._waiters[key] = 1
+            return new_future, True
+
+    def leave(self, key: str, fut) -> int:
+        # -> requests still waiting on fut
+        with self._lock:
+            if self._futures.get(key) is not fut:
+                return 0
+            self._waiters[key] -= 1
+            return self._waiters[key]
+
+    def finish(self, key: str, fut):
+        with self._lock:
+            if self._futures.get(key) is fut:
+                del self._futures[key]
+                del self._waiters[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"coalesced": self.coalesced, "in_flight_sequences": len(self._futures)}
+
+# --- Global queue, limiter and upstream client ---
+cache = ResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL)
+inflight = InFlight()
+upstream_limits = httpx.Limits(max_connections=MAX_CONCURRENCY, max_keepalive_connections=MAX_CONCURRENCY)
+if PROXY_MODE == "async":
+    pq = AsyncPriorityQueue(make_policy(BATCH_POLICY))
+    limiter = AsyncAdaptiveLimiter(INITIAL_CONCURRENCY, MIN_CONCURRENCY, MAX_CONCURRENCY, AIMD_DECREASE)
+    client = httpx.AsyncClient(timeout=30.0, limits=upstream_limits)
+elif PROXY_MODE == "threads":
+    pq = PriorityQueue(make_policy(BATCH_POLICY))
+    limiter = AdaptiveLimiter(INITIAL_CONCURRENCY, MIN_CONCURRENCY, MAX_CONCURRENCY, AIMD_DECREASE)
+    # One pooled client shared by all dispatchers (httpx.Client is thread-safe)
+    client = httpx.Client(timeout=30.0, limits=upstream_limits)
+else:
+    raise ValueError(f"Unknown PROXY_MODE '{PROXY_MODE}', expected async or threads")
+
+def _retry_after(resp) -> float:
+    try:
+        return float(resp.headers.get("Retry-After", 0))
+    except ValueError:
+        return 0.0
+
+def _results(resp):
+    # -> the batch's results, or None on a 429 (raises on any other failure)
+    if resp.status_code == 429:
+        return None
+    resp.raise_for_status()
+    return resp.json()["results"]
 
-# --- Global queue and worker ---
-pq = PriorityQueue()
+def _resolve(batch: List[PrioritizedItem], results):
+    # Set results/errors for all Futures, skipping requests that gave up waiting
+    if isinstance(results, Exception):
+        results = [results] * len(batch)
+    for item, res in zip(batch, results):
+        if item.future.done():
+            continue
+        if isinstance(res, Exception):
+            item.future.set_exception(res)
+        else:
+            item.future.set_result(res)
+
+def send_batch(sequences: List[str]):
+    # Called holding a limiter slot, which retries keep: every attempt reports
+    # its outcome, so 429s shrink the number of batches dispatchers may hold
+    # at once. 429s have their own, larger retry budget.
+    error = None
+    attempts = overloads = 0
+    while attempts < MAX_ATTEMPTS and overloads < MAX_OVERLOAD_RETRIES:
+        outcome = "error"
+        sent_at = limiter.start()
+        try:
+            resp = client.post(CLASSIFICATION_SERVER_URL, json={"sequences": sequences})
+            results = _results(resp)
+            if results is None:
+                outcome = "overload"
+                overloads += 1
+                error = RuntimeError("Classification server is rate limiting (429)")
+                pause = _retry_after(resp) + random.uniform(0, OVERLOAD_PAUSE)
+            else:
+                outcome = "success"
+                return results
+        except Exception as e:
+            attempts += 1
+            print(f"Classification request failed (attempt {attempts}): {e}")
+            error = e
+            pause = 0.05 * attempts
+        finally:
+            limiter.finish(outcome, sent_at)
+        time.sleep(pause)
+    return error
 
 def classification_worker():
-    client = httpx.Client(timeout=30.0)
     while True:
-        batch = []
-        # Wait for there to be something to process
-        # waiting_time = 0.0
-        while len(pq) == 0:
-            # waiting_time += 0.1
-            time.sleep(0.001)
-        # print(f"processing : {len(pq)}")
-        # Always pop up to MAX_BATCH elements thread-safely
-        batch = pq.pop_n(MAX_BATCH)
-        sequences = [item.sequence for item in batch]
-        # max_len = max((len(s) for s in sequences), default=0)
-        # Send to classification server with robust error/429 handling
-        request_data = {"sequences": sequences}
-        for attempt in range(3):
-            try:
-                # start_time = time.time()
-                resp = client.post(CLASSIFICATION_SERVER_URL, json=request_data)
-                if resp.status_code == 429:
-                    # Rate limited, wait and retry
-                    print(f"retrying")
-                    time.sleep(0.1 * (attempt + 1))
-                    continue
-
-                # print(f"{len(batch)} Max sequence ----> {max_len} : Processing time --> {(time.time() - start_time)}")
-                resp.raise_for_status()
-                results = resp.json()["results"]
-                break  # Success!
-            except Exception as e:
-                print("Exception occured")
-                if attempt == 2:  # Final attempt
-                    results = [e] * len(batch)
-                else:
-                    time.sleep(0.05 * (attempt + 1))
-        # Set results/errors for all Futures
-        futures = [item.future for item in batch]
-        for fut, res in zip(futures, results):
-            if isinstance(res, Exception):
-                fut.set_exception(res)
+        # A slot comes first: while the upstream is at its limit no batch is
+        # sealed, so the queue backs up and the next batch taken is full (and
+        # holds the longest requests that arrived meanwhile). pop_batch then
+        # blocks without polling until the batch is full or its wait is over.
+        limiter.acquire()
+        try:
+            batch = pq.pop_batch(MAX_BATCH_WAIT)
+            _resolve(batch, send_batch([item.sequence for item in batch]))
+        finally:
+            limiter.release()
+
+# Async mode: the same dispatch loop as coroutines on the event loop
+async def async_send_batch(sequences: List[str]):
+    error = None
+    attempts = overloads = 0
+    while attempts < MAX_ATTEMPTS and overloads < MAX_OVERLOAD_RETRIES:
+        outcome = "error"
+        sent_at = limiter.start()
+        try:
+            resp = await client.post(CLASSIFICATION_SERVER_URL, json={"sequences": sequences})
+            results = _results(resp)
+            if results is None:
+                outcome = "overload"
+                overloads += 1
+                error = RuntimeError("Classification server is rate limiting (429)")
+                pause = _retry_after(resp) + random.uniform(0, OVERLOAD_PAUSE)
             else:
-                fut.set_result(res)
+                outcome = "success"
+                return results
+        except Exception as e:
+            attempts += 1
+            print(f"Classification request failed (attempt {attempts}): {e}")
+            error = e
+            pause = 0.05 * attempts
+        finally:
+            limiter.finish(outcome, sent_at)
+        await asyncio.sleep(pause)
+    return error
+
+async def async_classification_worker():
+    while True:
+        await limiter.acquire()
+        try:
+            batch = await pq.pop_batch(MAX_BATCH_WAIT)
+            _resolve(batch, await async_send_batch([item.sequence for item in batch]))
+        finally:
+            await limiter.release()
 
-worker_thread = Thread(target=classification_worker, daemon=True)
-worker_thread.start()
+if PROXY_MODE == "threads":
+    worker_threads = [Thread(target=classification_worker, daemon=True, name=f"dispatcher-{i}")
+                      for i in range(DISPATCHERS)]
+    for worker_thread in worker_threads:
+        worker_thread.start()
+
+# --- Current concurrency limit, queue depth, batch shape and cache/coalescing hits ---
+@app.get("/stats")
+def stats():
+    return {**limiter.stats(), **pq.stats(), **cache.stats(), **inflight.stats()}
 
 # --- API endpoint: only enqueues, does no batching/sending itself ---
-@app.post("/proxy_classify", response_model=ProxyResponse)
-def proxy_classify(req: ProxyRequest):
-    fut = Future()
-    item = PrioritizedItem(
-        priority=-len(req.sequence),  # max-heap: longer first
+def _new_item(sequence: str, fut) -> PrioritizedItem:
+    return PrioritizedItem(
+        priority=-len(sequence),  # max-heap: longer first
         id=str(uuid.uuid4()),
-        sequence=req.sequence,
+        sequence=sequence,
         future=fut,
     )
-    pq.push(item)
-    try:
-        result = fut.result(timeout=30.0)
+
+def _on_done(key: str, fut):
+    # Runs once the shared future is resolved (or cancelled). The result is
+    # cached before the in-flight entry goes, so a request arriving in
+    # between finds one or the other and is never sent upstream again.
+    if not fut.cancelled() and fut.exception() is None:
+        cache.put(key, fut.result())
+    inflight.finish(key, fut)
+
+if PROXY_MODE == "async":
+    # A waiting request is a suspended coroutine, not a blocked thread
+    @app.post("/proxy_classify", response_model=ProxyResponse)
+    async def proxy_classify(req: ProxyRequest):
+        key = sequence_key(req.sequence)
+        result = cache.get(key)
+        if result is not None:
+            return ProxyResponse(result=result)
+        fut, created = inflight.join(key, asyncio.get_running_loop().create_future())
+        if created:
+            fut.add_done_callback(partial(_on_done, key))
+        try:
+            if created:
+                await pq.push(_new_item(req.sequence, fut))
+            # Shielded: one waiter timing out must not cancel the shared future
+            result = await asyncio.wait_for(asyncio.shield(fut), timeout=REQUEST_TIMEOUT)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Classification failed: {e}")
+        finally:
+            # Also runs when the client disconnects (CancelledError): the last
+            # waiter to leave cancels the future, so the item is dropped if still queued
+            if inflight.leave(key, fut) == 0 and not fut.done():
+                fut.cancel()
         return ProxyResponse(result=result)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Classification failed: {e}")
+else:
+    @app.post("/proxy_classify", response_model=ProxyResponse)
+    def proxy_classify(req: ProxyRequest):
+        key = sequence_key(req.sequence)
+        result = cache.get(key)
+        if result is not None:
+            return ProxyResponse(result=result)
+        fut, created = inflight.join(key, Future())
+        if created:
+            fut.add_done_callback(partial(_on_done, key))
+            pq.push(_new_item(req.sequence, fut))
+        try:
+            result = fut.result(timeout=REQUEST_TIMEOUT)
+            return ProxyResponse(result=result)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Classification failed: {e}")
@@ -0,0 +1,226 @@
+import asyncio
+import json
+import logging
+import re
+import time
+import concurrent.futures
+from typing import Callable, List
+
+logger = logging.getLogger(__name__)
+
+
+# ==== TOURNAMENT RERANKING ====
+# Candidates are split into chunks that are scored independently (and
+# concurrently), merged by score, and optionally the merged top-k is scored
+# once more in a single prompt so scores from different chunks become
+# comparable. A chunk whose response can't be used is retried on its own;
+# if it keeps failing only its candidates lose their score.
+#
+# score_chunk(chunk, attempt) returns the chunk's scored docs (each with a
+# "ranking_score") and raises on an unusable response.
+
+def make_chunks(docs: list, chunk_size: int) -> List[list]:
+    return [docs[i : i + chunk_size] for i in range(0, len(docs), chunk_size)]
+
+
+def merge_chunks(chunks: List[list], results: List[list]) -> list:
+    # Scored docs first by score (stable, so ties keep retrieval order), then
+    # docs of chunks that never scored, in their original order
+    scored = [doc for result in results if result is not None for doc in result]
+    scored.sort(key=lambda doc: doc["ranking_score"], reverse=True)
+    unscored = [doc for chunk, result in zip(chunks, results) if result is None for doc in chunk]
+    return scored + unscored
+
+
+def _apply_final(merged: list, final: list, final_top_k: int) -> list:
+    if final is None:
+        return merged
+    return final + merged[final_top_k:]
+
+
+def tournament_rerank(docs: list, score_chunk: Callable, chunk_size: int = 10, workers: int = 5,
+                      max_retries: int = 2, final_top_k: int = 0) -> list:
+    chunks = make_chunks(docs, chunk_size)
+    results = [None] * len(chunks)
+    pending = list(range(len(chunks)))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        for attempt in range(max_retries + 1):
+            futures = {pool.submit(score_chunk, chunks[i], attempt): i for i in pending}
+            pending = []
+            for fut in concurrent.futures.as_completed(futures):
+                i = futures[fut]
+                try:
+                    results[i] = fut.result()
+                except Exception as e:
+                    logger.warning(f"Rerank chunk {i + 1}/{len(chunks)} failed (attempt {attempt + 1}): {e}")
+                    pending.append(i)
+            if not pending:
+                break
+    if pending:
+        logger.error(f"{len(pending)} rerank chunk(s) left unscored after {max_retries + 1} attempts")
+
+    merged = merge_chunks(chunks, results)
+    final = None
+    if final_top_k and len(chunks) > 1:
+        try:
+            final = score_chunk(merged[:final_top_k], 0)
+        except Exception as e:
+            logger.warning(f"Final rerank pass failed, keeping merged chunk order: {e}")
+    return _apply_final(merged, final, final_top_k)
+
+
+async def atournament_rerank(docs: list, ascore_chunk: Callable, chunk_size: int = 10, workers: int = 5,
+                             max_retries: int = 2, final_top_k: int = 0) -> list:
+    chunks = make_chunks(docs, chunk_size)
+    semaphore = asyncio.Semaphore(workers)
+
+    async def score(i):
+        for attempt in range(max_retries + 1):
+            try:
+                async with semaphore:
+                    return await ascore_chunk(chunks[i], attempt)
+            except Exception as e:
+                logger.warning(f"Rerank chunk {i + 1}/{len(chunks)} failed (attempt {attempt + 1}): {e}")
+        logger.error(f"Rerank chunk {i + 1}/{len(chunks)} left unscored after {max_retries + 1} attempts")
+        return None
+
+    results = await asyncio.gather(*(score(i) for i in range(len(chunks))))
+    merged = merge_chunks(chunks, results)
+    final = None
+    if final_top_k and len(chunks) > 1:
+        try:
+            final = await ascore_chunk(merged[:final_top_k], 0)
+        except Exception as e:
+            logger.warning(f"Final rerank pass failed, keeping merged chunk order: {e}")
+    return _apply_final(merged, final, final_top_k)
+
+
+# ==== STREAMING RERANKING ====
+# The rerank response is {"results": [{...}, {...}, ...]}. ResultsStreamParser
+# is fed the streamed text and returns each results[] element as soon as its
+# closing brace arrives, so candidates can be shown before the model is done.
+
+RANKING_DETAIL_FIELDS = (
+    "hard_constraints_passed",
+    "hard_constraints_failed",
+    "detailed_reason_for_ranking",
+    "failed_constraints",
+)
+RESULTS_ARRAY_START = re.compile(r'"results"\s*:\s*\[')
+
+
+class ResultsStreamParser:
+    def __init__(self):
+        self._buf = ""
+        self._pos = 0
+        self._in_results = False
+        self._done = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._start = None
+
+    def feed(self, text: str) -> list:
+        if self._done or not text:
+            return []
+        self._buf += text
+        if not self._in_results:
+            match = RESULTS_ARRAY_START.search(self._buf)
+            if not match:
+                return []
+            self._in_results = True
+            self._pos = match.end()
+
+        completed = []
+        buf = self._buf
+        i = self._pos
+        while i < len(buf):
+            c = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+            elif c == '"':
+                self._in_string = True
+            elif c in "{[":
+                if self._depth == 0:
+                    self._start = i
+                self._depth += 1
+            elif c in "}]":
+                if self._depth == 0:
+                    # End of the results array
+                    self._done = True
+                    break
+                self._depth -= 1
+                if self._depth == 0:
+                    element = buf[self._start : i + 1]
+                    self._start = None
+                    try:
+                        completed.append(json.loads(element))
+                    except json.JSONDecodeError as e:
+                        logger.warning(f"Skipping malformed streamed rerank result: {e}")
+            i += 1
+
+        # Only the element currently being received needs to stay buffered
+        keep = self._start if self._start is not None else i
+        self._buf = buf[keep:]
+        self._pos = i - keep
+        if self._start is not None:
+            self._start = 0
+        return completed
+
+
+def attach_ranking(obj: dict, docs_by_id: dict):
+    # Copies an LLM result onto its candidate doc. Returns None for unknown ids
+    # and for score 0 (those docs are dropped, but still carry their score)
+    key = str(obj.get("_id", "")).strip()
+    if key not in docs_by_id:
+        return None
+    doc = docs_by_id[key]
+    doc["ranking_score"] = obj.get("ranking_score", 0)
+    # Present depending on the scoring schema (full reasons vs fast codes)
+    for field in RANKING_DETAIL_FIELDS:
+        if field in obj:
+            doc[field] = obj[field]
+    return doc if doc["ranking_score"] > 0 else None
+
+
+class RankingStream:
+    # Iterate (sync or async, matching `deltas`) to receive scored candidate
+    # docs in arrival order; ranked() gives the final sorted view afterwards.
+    def __init__(self, deltas, docs_by_id: dict):
+        self._deltas = deltas
+        self._docs_by_id = docs_by_id
+        self._started = time.perf_counter()
+        self.docs = []
+        self.first_candidate_seconds = None
+        self.total_seconds = None
+
+    def _accept(self, objects):
+        for obj in objects:
+            doc = attach_ranking(obj, self._docs_by_id)
+            if doc is None:
+                continue
+            if self.first_candidate_seconds is None:
+                self.first_candidate_seconds = time.perf_counter() - self._started
+            self.docs.append(doc)
+            yield doc
+
+    def __iter__(self):
+        parser = ResultsStreamParser()
+        for text in self._deltas:
+            yield from self._accept(parser.feed(text))
+        self.total_seconds = time.perf_counter() - self._started
+
+    async def __aiter__(self):
+        parser = ResultsStreamParser()
+        async for text in self._deltas:
+            for doc in self._accept(parser.feed(text)):
+                yield doc
+        self.total_seconds = time.perf_counter() - self._started
+
+    def ranked(self) -> list:
+        return sorted(self.docs, key=lambda doc: doc["ranking_score"], reverse=True)
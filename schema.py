@@ -71,3 +71,106 @@ ENHANCED_RE_RANK_SCHEMA = {
     "required": ["results"],
     "additionalProperties": False
 }
+
+# Scores only: no per-candidate explanation tokens
+FAST_RE_RANK_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "results": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "_id": {
+                        "type": "string",
+                        "description": "Document ID"
+                    },
+                    "ranking_score": {
+                        "type": "integer",
+                        "minimum": 0,
+                        "maximum": 100,
+                        "description": "Score 0-100"
+                    }
+                },
+                "required": ["_id", "ranking_score"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["results"],
+    "additionalProperties": False
+}
+
+# Scores plus short codes for the failed hard constraints
+FAST_RE_RANK_WITH_CODES_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "results": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "_id": {
+                        "type": "string",
+                        "description": "Document ID"
+                    },
+                    "ranking_score": {
+                        "type": "integer",
+                        "minimum": 0,
+                        "maximum": 100,
+                        "description": "Score 0-100"
+                    },
+                    "failed_constraints": {
+                        "type": "array",
+                        "items": {
+                            "type": "string",
+                            "enum": ["degree", "role", "country", "top_institution", "other"]
+                        },
+                        "description": "Codes of the hard constraints that failed"
+                    }
+                },
+                "required": ["_id", "ranking_score", "failed_constraints"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["results"],
+    "additionalProperties": False
+}
+
+# On-demand explanations for already scored candidates
+EXPLANATION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "results": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "_id": {
+                        "type": "string",
+                        "description": "Document ID"
+                    },
+                    "hard_constraints_passed": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "List of hard constraints that passed"
+                    },
+                    "hard_constraints_failed": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "List of hard constraints that failed"
+                    },
+                    "detailed_reason_for_ranking": {
+                        "type": "string",
+                        "description": "Explanation for the given score including constraint verification"
+                    }
+                },
+                "required": ["_id", "hard_constraints_passed", "hard_constraints_failed", "detailed_reason_for_ranking"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["results"],
+    "additionalProperties": False
+}
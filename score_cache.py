@@ -0,0 +1,84 @@
+import hashlib
+import json
+import os
+
+from disk_cache import DiskCache
+from rerank import RANKING_DETAIL_FIELDS
+
+# ==== CONFIGURATION ====
+SCORE_CACHE_PATH = os.environ.get("SCORE_CACHE_PATH", ".cache/rerank_scores.sqlite")
+SCORE_CACHE_MAX_BYTES = 128 * 1024 * 1024
+SCORE_CACHE_TTL = 7 * 24 * 3600         # seconds
+SCORE_CACHE_ENABLED = os.environ.get("SCORE_CACHE", "1") != "0"
+
+score_store = DiskCache(SCORE_CACHE_PATH, max_bytes=SCORE_CACHE_MAX_BYTES, ttl=SCORE_CACHE_TTL, enabled=SCORE_CACHE_ENABLED)
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+def prompt_version(*parts) -> str:
+    # Anything that changes what the judge sees or returns (rules text,
+    # scoring mode, model, serialization budget) must be part of the version
+    return hashlib.sha256(json.dumps(parts, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+# ==== PER-CANDIDATE SCORE CACHE ====
+# Scores are stored per (normalized query, mongo_id, prompt version), so a
+# repeated or overlapping search only sends candidates it hasn't seen to the
+# LLM. Zero scores are cached too: they were judged, just not kept.
+
+class ScoreCache:
+    def __init__(self, store: DiskCache = score_store):
+        self.store = store
+
+    def _key(self, query: str, mongo_id: str, version: str) -> str:
+        query_hash = hashlib.sha256(normalize_query(query).encode("utf-8")).hexdigest()
+        return f"{version}:{query_hash}:{mongo_id}"
+
+    def split(self, query: str, docs: list, version: str):
+        # -> (docs with cached scores applied, docs still to be scored)
+        keys = [self._key(query, str(doc["_id"]), version) for doc in docs]
+        cached = self.store.get_many(keys)
+        hits, misses = [], []
+        for doc, key in zip(docs, keys):
+            if key in cached:
+                doc.update(json.loads(cached[key]))
+                hits.append(doc)
+            else:
+                for field in ("ranking_score",) + RANKING_DETAIL_FIELDS:
+                    doc.pop(field, None)
+                misses.append(doc)
+        return hits, misses
+
+    def store_scored(self, query: str, docs: list, version: str):
+        # Only docs the LLM actually scored this time carry a ranking_score
+        items = {}
+        for doc in docs:
+            if "ranking_score" not in doc:
+                continue
+            entry = {field: doc[field] for field in ("ranking_score",) + RANKING_DETAIL_FIELDS if field in doc}
+            items[self._key(query, str(doc["_id"]), version)] = json.dumps(entry).encode("utf-8")
+        self.store.put_many(items)
+
+
+def merge_scored(cached_hits: list, fresh_ranked: list) -> list:
+    # The fresh ranking keeps its own order (a tournament's final pass puts its
+    # top-k first, whatever their raw scores). Cached hits (score > 0) are
+    # merged in by score, each ahead of the first fresh doc it outscores;
+    # unscored docs (failed chunks / fallbacks) stay last
+    cached = sorted((doc for doc in cached_hits if doc["ranking_score"] > 0),
+                    key=lambda doc: doc["ranking_score"], reverse=True)
+    if not cached:
+        return fresh_ranked
+    merged, i = [], 0
+    for doc in fresh_ranked:
+        if "ranking_score" not in doc:
+            continue
+        while i < len(cached) and cached[i]["ranking_score"] > doc["ranking_score"]:
+            merged.append(cached[i])
+            i += 1
+        merged.append(doc)
+    unscored = [doc for doc in fresh_ranked if "ranking_score" not in doc]
+    return merged + cached[i:] + unscored
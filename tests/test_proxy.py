@@ -0,0 +1,162 @@
+import asyncio
+import json
+import os
+import sys
+
+import httpx
+import pytest
+
+# The proxy is a standalone app in proxy_server/; its mode is fixed at import
+os.environ.setdefault("PROXY_MODE", "async")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "proxy_server"))
+
+import proxy  # noqa: E402
+
+if proxy.PROXY_MODE != "async":
+    pytest.skip("the proxy tests drive the async dispatchers", allow_module_level=True)
+
+
+# Mock classification server: records every batch it receives and answers
+# "label:<sequence>" for each, or a 429 for the first `overloads` batches
+class Upstream:
+    def __init__(self, delay: float = 0.0, overloads: int = 0):
+        self.delay = delay
+        self.overloads = overloads
+        self.batches = []
+        self.limits = []  # the proxy's concurrency limit as each batch arrived
+        self.active = 0
+        self.max_active = 0
+        self.hold = None  # an asyncio.Event the first batch waits for, if set
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        sequences = json.loads(request.content)["sequences"]
+        self.batches.append(sequences)
+        self.limits.append(proxy.limiter._limit)
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            if self.hold is not None and len(self.batches) == 1:
+                await self.hold.wait()
+            await asyncio.sleep(self.delay)
+        finally:
+            self.active -= 1
+        if self.overloads:
+            self.overloads -= 1
+            return httpx.Response(429)
+        return httpx.Response(200, json={"results": [f"label:{sequence}" for sequence in sequences]})
+
+    def sent(self) -> list:
+        return [sequence for batch in self.batches for sequence in batch]
+
+
+# Fresh queue, limiter, cache and client per test, built on the test's event
+# loop; the result cache is off so only coalescing can save upstream calls
+def install(monkeypatch, upstream: Upstream, initial: int = proxy.INITIAL_CONCURRENCY,
+            maximum: int = proxy.MAX_CONCURRENCY):
+    monkeypatch.setattr(proxy, "pq", proxy.AsyncPriorityQueue(proxy.LongestPolicy(5)))
+    monkeypatch.setattr(proxy, "limiter", proxy.AsyncAdaptiveLimiter(initial, proxy.MIN_CONCURRENCY, maximum,
+                                                                     proxy.AIMD_DECREASE))
+    monkeypatch.setattr(proxy, "cache", proxy.ResultCache(0, proxy.RESULT_CACHE_TTL))
+    monkeypatch.setattr(proxy, "inflight", proxy.InFlight())
+    monkeypatch.setattr(proxy, "client", httpx.AsyncClient(transport=httpx.MockTransport(upstream.handle)))
+    monkeypatch.setattr(proxy, "OVERLOAD_PAUSE", 0.0)
+    return [asyncio.create_task(proxy.async_classification_worker()) for _ in range(proxy.DISPATCHERS)]
+
+
+async def stop(dispatchers):
+    for task in dispatchers:
+        task.cancel()
+    await asyncio.gather(*dispatchers, return_exceptions=True)
+    await proxy.client.aclose()
+
+
+async def classify(sequence: str) -> str:
+    return (await proxy.proxy_classify(proxy.ProxyRequest(sequence=sequence))).result
+
+
+def test_queued_requests_go_out_in_full_batches(monkeypatch):
+    # Longest first: 20 distinct lengths queued at once make 4 batches of 5
+    monkeypatch.setattr(proxy, "MAX_BATCH_WAIT", 0.2)
+    sequences = ["x" * n for n in range(1, 21)]
+
+    async def scenario():
+        upstream = Upstream(delay=0.01)
+        dispatchers = install(monkeypatch, upstream)
+        try:
+            results = await asyncio.gather(*(classify(sequence) for sequence in sequences))
+        finally:
+            await stop(dispatchers)
+        assert results == [f"label:{sequence}" for sequence in sequences]
+        assert [len(batch) for batch in upstream.batches] == [5, 5, 5, 5]
+        assert upstream.batches[0] == sorted(sequences, key=len, reverse=True)[:5]
+
+    asyncio.run(scenario())
+
+
+def test_coalesced_requests_are_sent_once(monkeypatch):
+    sequences = ["same"] * 10 + ["other", "another", "same"]
+
+    async def scenario():
+        upstream = Upstream(delay=0.01)
+        dispatchers = install(monkeypatch, upstream)
+        try:
+            results = await asyncio.gather(*(classify(sequence) for sequence in sequences))
+        finally:
+            await stop(dispatchers)
+        assert results == [f"label:{sequence}" for sequence in sequences]
+        assert sorted(upstream.sent()) == ["another", "other", "same"]
+        assert proxy.inflight.stats() == {"coalesced": 10, "in_flight_sequences": 0}
+
+    asyncio.run(scenario())
+
+
+def test_limit_grows_when_saturated_and_halves_on_429(monkeypatch):
+    async def scenario():
+        upstream = Upstream(delay=0.005)
+        dispatchers = install(monkeypatch, upstream)
+        try:
+            await asyncio.gather(*(classify(f"seq-{i:03d}") for i in range(100)))
+            grown = proxy.limiter._limit
+            assert grown > proxy.INITIAL_CONCURRENCY
+            assert upstream.max_active <= int(grown)
+
+            # One 429: the retry goes out under half the limit, and still succeeds
+            upstream.overloads = 1
+            assert await classify("throttled") == "label:throttled"
+        finally:
+            await stop(dispatchers)
+        assert upstream.batches[-2:] == [["throttled"], ["throttled"]]
+        assert upstream.limits[-1] == pytest.approx(grown * proxy.AIMD_DECREASE)
+        assert proxy.limiter.stats()["overloads"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiters_are_dropped_from_the_queue(monkeypatch):
+    async def scenario():
+        # One slot, held by the first request until the upstream lets it go
+        upstream = Upstream()
+        upstream.hold = asyncio.Event()
+        dispatchers = install(monkeypatch, upstream, initial=1, maximum=1)
+        try:
+            first = asyncio.create_task(classify("first"))
+            while not upstream.batches:
+                await asyncio.sleep(0.001)
+            dropped = asyncio.create_task(classify("dropped"))
+            shared = [asyncio.create_task(classify("shared")) for _ in range(2)]
+            await asyncio.sleep(0.01)
+            assert len(proxy.pq) == 2
+
+            # "dropped" loses its only waiter, "shared" still has one left
+            dropped.cancel()
+            shared[0].cancel()
+            await asyncio.gather(dropped, shared[0], return_exceptions=True)
+            upstream.hold.set()
+            assert await first == "label:first"
+            assert await shared[1] == "label:shared"
+        finally:
+            await stop(dispatchers)
+        assert upstream.batches == [["first"], ["shared"]]
+        assert len(proxy.pq) == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,127 @@
+import numpy as np
+import pytest
+
+from vector_index import DENSE_FILTER_RATIO, IndexWriter, LocalVectorIndex
+
+# Small synthetic corpus; every search is checked against NumPy brute force
+COUNT = 2000
+DIM = 32
+LIMIT = 20
+COUNTRIES = ["United States", "India", "United Kingdom", "Germany"]
+
+
+def corpus(seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((16, DIM)).astype(np.float32)
+    vectors = centers[rng.integers(len(centers), size=COUNT)] + rng.standard_normal((COUNT, DIM)).astype(np.float32)
+    payloads = [{"mongo_id": f"{i:024x}", "country": COUNTRIES[i % 4], "yearsOfWorkExperience": i % 15,
+                 "prestigeScore": float(i % 100) / 100} for i in range(COUNT)]
+    queries = rng.standard_normal((5, DIM)).astype(np.float32)
+    return vectors, payloads, queries
+
+
+def build(path, dtype: str = "float32", ivf_lists: int = 0) -> LocalVectorIndex:
+    vectors, payloads, _ = corpus()
+    writer = IndexWriter(str(path), dim=DIM, dtype=dtype)
+    for start in range(0, COUNT, 500):
+        writer.add(vectors[start : start + 500], payloads[start : start + 500])
+    writer.finalize(ivf_lists=ivf_lists)
+    return LocalVectorIndex.load(str(path))
+
+
+def brute_force(query, limit: int = LIMIT, dtype: str = "float32", keep=None):
+    vectors, payloads, _ = corpus()
+    vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors.astype(dtype).astype(np.float32)
+    query = query / np.linalg.norm(query)
+    scores = vectors @ query.astype(np.float32)
+    rows = np.array([i for i, payload in enumerate(payloads) if keep is None or keep(payload)], dtype=np.int64)
+    order = np.argsort(-scores[rows], kind="stable")[:limit]
+    return [int(row) for row in rows[order]], scores[rows[order]]
+
+
+def assert_same(hits, expected):
+    rows, scores = expected
+    assert [hit.id for hit in hits] == rows
+    np.testing.assert_allclose([hit.score for hit in hits], scores, rtol=1e-5, atol=1e-6)
+
+
+COUNTRY_FILTER = {"must": [{"key": "country", "match": {"value": "India"}}]}
+YOE_FILTER = {"must": [{"key": "yearsOfWorkExperience", "match": {"value": 3}}]}
+RANGE_FILTER = {"must": [{"key": "yearsOfWorkExperience", "range": {"gte": 2, "lt": 5}},
+                         {"key": "prestigeScore", "range": {"gt": 0.25, "lte": 0.75}}]}
+
+
+@pytest.fixture(scope="module")
+def index(tmp_path_factory):
+    return build(tmp_path_factory.mktemp("index"))
+
+
+@pytest.fixture(scope="module")
+def queries():
+    return corpus()[2]
+
+
+def test_exact_search_matches_brute_force(index, queries):
+    for query in queries:
+        assert_same(index.search(query, LIMIT), brute_force(query))
+
+
+def test_dense_filter_matches_brute_force(index, queries):
+    # 1 in 4 rows match: above DENSE_FILTER_RATIO, so everything is scored then masked
+    assert index.filter_mask(COUNTRY_FILTER).mean() > DENSE_FILTER_RATIO
+    for query in queries:
+        assert_same(index.search(query, LIMIT, query_filter=COUNTRY_FILTER),
+                    brute_force(query, keep=lambda p: p["country"] == "India"))
+
+
+def test_sparse_filter_matches_brute_force(index, queries):
+    # 1 in 15 rows match: below DENSE_FILTER_RATIO, so only matching rows are scored
+    assert index.filter_mask(YOE_FILTER).mean() <= DENSE_FILTER_RATIO
+    for query in queries:
+        assert_same(index.search(query, LIMIT, query_filter=YOE_FILTER),
+                    brute_force(query, keep=lambda p: p["yearsOfWorkExperience"] == 3))
+
+
+def test_range_filter_matches_brute_force(index, queries):
+    def keep(payload):
+        return 2 <= payload["yearsOfWorkExperience"] < 5 and 0.25 < payload["prestigeScore"] <= 0.75
+
+    for query in queries:
+        assert_same(index.search(query, LIMIT, query_filter=RANGE_FILTER), brute_force(query, keep=keep))
+
+
+def test_unknown_country_matches_nothing(index, queries):
+    query_filter = {"must": [{"key": "country", "match": {"value": "Atlantis"}}]}
+    assert index.search(queries[0], LIMIT, query_filter=query_filter) == []
+
+
+def test_float16_storage_matches_brute_force(tmp_path, queries):
+    index = build(tmp_path, dtype="float16")
+    assert index.vectors.dtype == np.float16
+    for query in queries:
+        assert_same(index.search(query, LIMIT), brute_force(query, dtype="float16"))
+
+
+def test_ivf_probing_every_list_matches_brute_force(tmp_path, queries):
+    index = build(tmp_path, ivf_lists=8)
+    n_lists = index.meta["ivf_lists"]
+    for query in queries:
+        assert_same(index.search(query, LIMIT, mode="ivf", nprobe=n_lists), brute_force(query))
+        assert_same(index.search(query, LIMIT, query_filter=YOE_FILTER, mode="ivf", nprobe=n_lists),
+                    brute_force(query, keep=lambda p: p["yearsOfWorkExperience"] == 3))
+
+
+def test_ivf_nprobe_zero_still_probes_one_list(tmp_path, queries):
+    index = build(tmp_path, ivf_lists=8)
+    hits = index.search(queries[0], LIMIT, mode="ivf", nprobe=0)
+    assert hits == index.search(queries[0], LIMIT, mode="ivf", nprobe=1)
+    assert len(hits) == LIMIT
+
+
+def test_row_lookup_by_mongo_id(index):
+    vectors, payloads, _ = corpus()
+    assert index.row(payloads[1234]["mongo_id"]) == 1234
+    assert index.row("f" * 24) is None
+    np.testing.assert_allclose(index.vector(payloads[7]["mongo_id"]),
+                               vectors[7] / np.linalg.norm(vectors[7]), rtol=1e-5)
@@ -0,0 +1,394 @@
+import argparse
+import json
+import os
+import time
+from threading import Lock
+from typing import List, NamedTuple
+
+import numpy as np
+
+# ==== LOCAL VECTOR INDEX ====
+# In-process alternative to the Qdrant collection for a corpus small enough to
+# serve from one machine. On-disk layout (one directory):
+#   meta.json                  dim, count, dtype, country vocabulary, IVF info
+#   vectors.npy                (count, dim) L2-normalised float32/float16 rows
+#   mongo_ids.npy              (count,) mongo id strings, row aligned
+#   mongo_id_order.npy         (count,) int64 rows sorted by mongo id (id -> row lookup)
+#   country.npy                (count,) int32 codes into meta["countries"]
+#   yearsOfWorkExperience.npy  (count,) int32
+#   prestigeScore.npy          (count,) float32
+#   ivf_centroids.npy, ivf_order.npy, ivf_offsets.npy   (optional IVF lists)
+# Every array is opened with mmap_mode="r", so loading is zero-copy.
+
+PAYLOAD_COLUMNS = {
+    "yearsOfWorkExperience": np.int32,
+    "prestigeScore": np.float32,
+}
+SCORE_BLOCK_ROWS = 32768     # rows scored per block in exact mode
+DEFAULT_NPROBE = 16
+DENSE_FILTER_RATIO = 0.2     # above this selectivity, score everything then mask
+
+
+class LocalHit(NamedTuple):
+    # Mirrors the fields of qdrant_client's ScoredPoint that the pipeline reads
+    id: int
+    score: float
+    payload: dict
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    # argpartition is O(n); only the k winners get fully sorted
+    if k < len(scores):
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(len(scores))
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+# ==== WRITER ====
+# Rows can be appended in any number of chunks (e.g. one per streamed batch);
+# vectors are spooled to a raw temp file and only converted into the final
+# .npy matrix in finalize(), so memory stays bounded by the chunk size.
+
+class IndexWriter:
+    def __init__(self, path: str, dim: int = 1024, dtype: str = "float32"):
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"Unsupported vector dtype '{dtype}'")
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.dim = dim
+        self.dtype = dtype
+        self.count = 0
+        self._lock = Lock()
+        self._spool_path = os.path.join(path, "vectors.f32.tmp")
+        self._spool = open(self._spool_path, "wb")
+        self._mongo_ids = []
+        self._countries = []
+        self._columns = {name: [] for name in PAYLOAD_COLUMNS}
+
+    def add(self, vectors, payloads: List[dict]):
+        vectors = _normalize(vectors)
+        if vectors.ndim != 2 or vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected vectors of shape (n, {self.dim}), got {vectors.shape}")
+        if len(vectors) != len(payloads):
+            raise ValueError("vectors and payloads must have the same length")
+        with self._lock:
+            self._spool.write(vectors.tobytes())
+            for payload in payloads:
+                self._mongo_ids.append(str(payload["mongo_id"]))
+                self._countries.append(str(payload.get("country", "")))
+                for name in PAYLOAD_COLUMNS:
+                    self._columns[name].append(payload.get(name, 0))
+            self.count += len(payloads)
+
+    def finalize(self, ivf_lists: int = 0) -> "LocalVectorIndex":
+        self._spool.close()
+        spool = np.memmap(self._spool_path, dtype=np.float32, mode="r", shape=(self.count, self.dim)) if self.count else np.zeros((0, self.dim), np.float32)
+        out = np.lib.format.open_memmap(
+            os.path.join(self.path, "vectors.npy"), mode="w+", dtype=self.dtype, shape=(self.count, self.dim)
+        )
+        for start in range(0, self.count, SCORE_BLOCK_ROWS):
+            out[start : start + SCORE_BLOCK_ROWS] = spool[start : start + SCORE_BLOCK_ROWS]
+        out.flush()
+        del out, spool
+        os.remove(self._spool_path)
+
+        countries = sorted(set(self._countries))
+        codes = {country: i for i, country in enumerate(countries)}
+        mongo_ids = np.array(self._mongo_ids, dtype="U24")
+        np.save(os.path.join(self.path, "mongo_ids.npy"), mongo_ids)
+        np.save(os.path.join(self.path, "mongo_id_order.npy"), np.argsort(mongo_ids, kind="stable").astype(np.int64))
+        np.save(os.path.join(self.path, "country.npy"), np.array([codes[c] for c in self._countries], dtype=np.int32))
+        for name, dtype in PAYLOAD_COLUMNS.items():
+            np.save(os.path.join(self.path, f"{name}.npy"), np.array(self._columns[name], dtype=dtype))
+        meta = {"dim": self.dim, "count": self.count, "dtype": self.dtype, "countries": countries, "ivf_lists": 0}
+        with open(os.path.join(self.path, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+        index = LocalVectorIndex.load(self.path)
+        if ivf_lists:
+            index.train_ivf(ivf_lists)
+        return index
+
+
+# ==== INDEX ====
+
+class LocalVectorIndex:
+    def __init__(self, path: str, meta: dict, vectors: np.ndarray, mongo_ids: np.ndarray, columns: dict,
+                 mongo_id_order: np.ndarray = None):
+        self.path = path
+        self.meta = meta
+        self.vectors = vectors
+        self.mongo_ids = mongo_ids
+        self.columns = columns
+        self._mongo_id_order = mongo_id_order
+        self.countries = meta["countries"]
+        self._country_codes = {country: i for i, country in enumerate(self.countries)}
+        self._ivf = None
+        if meta.get("ivf_lists"):
+            self._ivf = tuple(
+                np.load(os.path.join(path, f"ivf_{name}.npy"), mmap_mode="r") for name in ("centroids", "order", "offsets")
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "LocalVectorIndex":
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        mongo_ids = np.load(os.path.join(path, "mongo_ids.npy"), mmap_mode="r")
+        columns = {"country": np.load(os.path.join(path, "country.npy"), mmap_mode="r")}
+        for name in PAYLOAD_COLUMNS:
+            columns[name] = np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+        order_path = os.path.join(path, "mongo_id_order.npy")
+        mongo_id_order = np.load(order_path, mmap_mode="r") if os.path.exists(order_path) else None
+        return cls(path, meta, vectors, mongo_ids, columns, mongo_id_order)
+
+    def __len__(self):
+        return len(self.mongo_ids)
+
+    def row(self, mongo_id: str):
+        # Binary search over the sorted id order -> row, or None if absent
+        if self._mongo_id_order is None:
+            # Index written before the order file existed
+            self._mongo_id_order = np.argsort(self.mongo_ids, kind="stable")
+        order = self._mongo_id_order
+        lo, hi = 0, len(order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.mongo_ids[order[mid]] < mongo_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(order) and self.mongo_ids[order[lo]] == mongo_id:
+            return int(order[lo])
+        return None
+
+    def vector(self, mongo_id: str):
+        row = self.row(mongo_id)
+        return None if row is None else self.vectors[row]
+
+    def payload(self, row: int) -> dict:
+        return {
+            "mongo_id": str(self.mongo_ids[row]),
+            "country": self.countries[self.columns["country"][row]],
+            "yearsOfWorkExperience": int(self.columns["yearsOfWorkExperience"][row]),
+            "prestigeScore": float(self.columns["prestigeScore"][row]),
+        }
+
+    # ---- filtering ----
+    # Accepts the Qdrant-style dict filter the pipeline builds:
+    #   {"must": [{"key": "country", "match": {"value": ...}},
+    #             {"key": "yearsOfWorkExperience", "range": {"gte": ..., "lte": ...}}]}
+    def filter_mask(self, query_filter: dict, rows: np.ndarray = None):
+        if not query_filter or not query_filter.get("must"):
+            return None
+        count = len(self) if rows is None else len(rows)
+        mask = np.ones(count, dtype=bool)
+        for condition in query_filter["must"]:
+            key = condition["key"]
+            if key not in self.columns:
+                raise ValueError(f"Local index has no payload column '{key}'")
+            column = self.columns[key] if rows is None else self.columns[key][rows]
+            if "match" in condition:
+                value = condition["match"]["value"]
+                if key == "country":
+                    code = self._country_codes.get(value)
+                    if code is None:
+                        return np.zeros(count, dtype=bool)
+                    value = code
+                mask &= column == value
+            if "range" in condition:
+                bounds = condition["range"]
+                if bounds.get("gte") is not None:
+                    mask &= column >= bounds["gte"]
+                if bounds.get("gt") is not None:
+                    mask &= column > bounds["gt"]
+                if bounds.get("lte") is not None:
+                    mask &= column <= bounds["lte"]
+                if bounds.get("lt") is not None:
+                    mask &= column < bounds["lt"]
+        return mask
+
+    # ---- search ----
+
+    def _score_rows(self, query: np.ndarray, rows: np.ndarray = None) -> np.ndarray:
+        if rows is not None:
+            return np.asarray(self.vectors[rows], dtype=np.float32) @ query
+        scores = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), SCORE_BLOCK_ROWS):
+            block = np.asarray(self.vectors[start : start + SCORE_BLOCK_ROWS], dtype=np.float32)
+            scores[start : start + len(block)] = block @ query
+        return scores
+
+    def search(self, query_vector, limit: int = 50, query_filter: dict = None,
+               mode: str = "exact", nprobe: int = DEFAULT_NPROBE) -> List[LocalHit]:
+        query = _normalize(query_vector)
+        if mode == "ivf" and self._ivf is not None:
+            rows = self._ivf_candidates(query, nprobe)
+        elif mode in ("exact", "ivf"):
+            rows = None
+        else:
+            raise ValueError(f"Unknown search mode '{mode}'")
+
+        mask = self.filter_mask(query_filter, rows)
+        if mask is not None and rows is None and mask.mean() > DENSE_FILTER_RATIO:
+            # Gathering most of the matrix costs more than scoring all of it
+            rows = np.flatnonzero(mask)
+            scores = self._score_rows(query)[rows]
+        else:
+            if mask is not None:
+                rows = np.flatnonzero(mask) if rows is None else rows[mask]
+            if rows is not None:
+                rows = np.sort(rows)
+                scores = self._score_rows(query, rows)
+            else:
+                scores = self._score_rows(query)
+        if len(scores) == 0:
+            return []
+
+        top = _top_k(scores, limit)
+        row_ids = top if rows is None else rows[top]
+        return [LocalHit(int(row), float(scores[i]), self.payload(row)) for i, row in zip(top, row_ids)]
+
+    # ---- IVF ----
+    # Spherical k-means coarse quantiser: rows are grouped by nearest centroid
+    # and a query only scores the rows of its `nprobe` closest lists.
+
+    def train_ivf(self, n_lists: int = None, iterations: int = 10, sample_size: int = 50_000, seed: int = 0):
+        count = len(self)
+        n_lists = min(n_lists or max(1, int(np.sqrt(count))), count)
+        rng = np.random.default_rng(seed)
+        sample_rows = np.sort(rng.choice(count, size=min(sample_size, count), replace=False))
+        sample = np.asarray(self.vectors[sample_rows], dtype=np.float32)
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            empty = np.bincount(assignment, minlength=n_lists) == 0
+            # Re-seed empty lists from random sample rows
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+            centroids = _normalize(sums)
+
+        assignment = np.empty(count, dtype=np.int32)
+        for start in range(0, count, SCORE_BLOCK_ROWS):
+            block = np.asarray(self.vectors[start : start + SCORE_BLOCK_ROWS], dtype=np.float32)
+            assignment[start : start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        order = np.argsort(assignment, kind="stable").astype(np.int64)
+        offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(assignment, minlength=n_lists))
+
+        for name, array in (("centroids", centroids), ("order", order), ("offsets", offsets)):
+            np.save(os.path.join(self.path, f"ivf_{name}.npy"), array)
+        self.meta["ivf_lists"] = n_lists
+        with open(os.path.join(self.path, "meta.json"), "w") as f:
+            json.dump(self.meta, f)
+        self._ivf = (centroids, order, offsets)
+
+    def _ivf_candidates(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        centroids, order, offsets = self._ivf
+        # At least one list is probed, so nprobe=0 can't leave nothing to search
+        lists = _top_k(np.asarray(centroids) @ query, max(1, min(nprobe, len(centroids))))
+        return np.concatenate([order[offsets[l] : offsets[l + 1]] for l in lists])
+
+
+# ==== QDRANT EXPORT ====
+
+def export_qdrant_collection(client, collection_name: str, path: str, dtype: str = "float32",
+                             ivf_lists: int = 0, page_size: int = 1000) -> LocalVectorIndex:
+    info = client.get_collection(collection_name)
+    writer = IndexWriter(path, dim=info.config.params.vectors.size, dtype=dtype)
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name, limit=page_size, offset=offset, with_payload=True, with_vectors=True
+        )
+        if points:
+            writer.add([p.vector for p in points], [p.payload for p in points])
+        if offset is None:
+            break
+    return writer.finalize(ivf_lists=ivf_lists)
+
+
+# ==== BENCHMARK ====
+# Synthetic clustered corpus (real resume embeddings cluster by profession):
+# checks IVF against brute force and reports query latency.
+
+def benchmark(count: int = 100_000, dim: int = 1024, dtype: str = "float32", queries: int = 50,
+              limit: int = 50, nprobe: int = DEFAULT_NPROBE, path: str = ".cache/bench_index"):
+    rng = np.random.default_rng(0)
+    writer = IndexWriter(path, dim=dim, dtype=dtype)
+    countries = ["United States", "India", "United Kingdom", "Germany"]
+    centers = rng.standard_normal((256, dim), dtype=np.float32)
+
+    def sample(n):
+        noise = rng.standard_normal((n, dim), dtype=np.float32) * 0.6
+        return centers[rng.integers(len(centers), size=n)] + noise
+
+    for start in range(0, count, 10_000):
+        n = min(10_000, count - start)
+        writer.add(
+            sample(n),
+            [{"mongo_id": f"{start + i:024x}", "country": countries[(start + i) % 4],
+              "yearsOfWorkExperience": (start + i) % 15, "prestigeScore": float((start + i) % 100) / 100}
+             for i in range(n)],
+        )
+    index = writer.finalize(ivf_lists=int(np.sqrt(count)))
+    query_vectors = sample(queries)
+    country_filter = {"must": [{"key": "country", "match": {"value": "United States"}}]}
+
+    for label, kwargs in (("exact", {}), ("exact+filter", {"query_filter": country_filter}),
+                          ("ivf", {"mode": "ivf", "nprobe": nprobe}),
+                          ("ivf+filter", {"mode": "ivf", "nprobe": nprobe, "query_filter": country_filter})):
+        start = time.perf_counter()
+        results = [index.search(q, limit, **kwargs) for q in query_vectors]
+        elapsed_ms = (time.perf_counter() - start) * 1000 / queries
+        line = f"{label:>14}: {elapsed_ms:7.2f} ms/query"
+        if kwargs.get("mode") == "ivf":
+            exact_kwargs = {k: v for k, v in kwargs.items() if k == "query_filter"}
+            recall = np.mean([
+                len({h.id for h in r} & {h.id for h in index.search(q, limit, **exact_kwargs)}) / limit
+                for q, r in zip(query_vectors, results)
+            ])
+            line += f"  recall@{limit}={recall:.3f}"
+        print(line)
+
+    # With every list probed IVF must return exactly the brute-force ranking
+    for q in query_vectors[:5]:
+        full = index.search(q, limit, mode="ivf", nprobe=index.meta["ivf_lists"])
+        exact = index.search(q, limit)
+        assert [h.id for h in full] == [h.id for h in exact], "IVF with nprobe=all differs from brute force"
+    print("ivf(nprobe=all) == exact: OK")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local vector index tools")
+    sub = parser.add_subparsers(dest="action", required=True)
+    export = sub.add_parser("export", help="Copy a Qdrant collection into a local index")
+    export.add_argument("--url", required=True)
+    export.add_argument("--api-key", default="")
+    export.add_argument("--collection", required=True)
+    export.add_argument("--out", required=True)
+    export.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    export.add_argument("--ivf-lists", type=int, default=0, help="Train IVF lists after export (0 = exact only)")
+    bench = sub.add_parser("bench", help="Benchmark exact vs IVF search on a random corpus")
+    bench.add_argument("--count", type=int, default=100_000)
+    bench.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    bench.add_argument("--nprobe", type=int, default=DEFAULT_NPROBE)
+    args = parser.parse_args()
+
+    if args.action == "export":
+        from qdrant_client import QdrantClient
+        index = export_qdrant_collection(
+            QdrantClient(url=args.url, api_key=args.api_key), args.collection, args.out, args.dtype, args.ivf_lists
+        )
+        print(f"Exported {len(index)} vectors to {args.out}")
+    else:
+        benchmark(count=args.count, dtype=args.dtype, nprobe=args.nprobe)